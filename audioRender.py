@@ -0,0 +1,501 @@
+'''
+Input arguments: filename of RNA structure to render to audio
+-Render the sonified structure straight to a stereo WAV file in 'audio', without Pure Data,
+ Ableton Live or a MIDI port, much faster than real time
+-The voices of the structure (melody, pseudoknots, pulse, pan and distance, see createMIDI.sonifyVoices)
+ are played by NumPy oscillators and envelopes: melody notes and chords are a few harmonics with a short
+ attack and release, pseudoknot notes a soft pad held from their '[' to their ']' and the pulse a short click
+-Pan (CC 21) places each note in the stereo field, distance (CC 20) sends it to a reverb
+ (an FFT convolution with a decaying noise impulse response) and lowers its dry level
+-The track is split in time-aligned chunks of a few seconds, rendered across worker processes
+ (-j, every CPU by default) and stitched with their overlapping reverb tails, held notes carry on
+ from chunk to chunk with the same phase
+-Structure files are streamed like createMIDI.py --stream does: the voices are sonified a few thousand
+ nucleotides at a time and a chunk of audio is made as soon as they reach its end, then written, so
+ memory depends on the chunk length, not on the length of the structure (renderAudio of a CSSD string
+ also holds the string, its pair table and its distances)
+-Timing follows the MIDI files (480 ticks per beat at 120 bpm), use --nucleotide-seconds to change it
+'''
+
+import os
+import sys
+import wave
+import argparse
+import itertools
+import collections
+import concurrent.futures
+import numpy as np
+import createMIDI
+import structureIndex
+
+# seconds per tick of the saved midi files: 480 ticks per beat at the default tempo (120 bpm)
+midiSecondsPerTick = 0.5 / 480
+
+# sound of each voice: amplitudes of the harmonics, attack, release and decay in seconds
+# (no decay holds the note till its note off) and gain
+timbres = {
+    'Melody': {'harmonics': [1.0, 0.5, 0.25, 0.125], 'attack': 0.005, 'release': 0.05, 'decay': None, 'gain': 0.16},
+    'Pseudoknots': {'harmonics': [1.0, 0.0, 1/9, 0.0, 1/25], 'attack': 0.04, 'release': 0.3, 'decay': None,
+                    'gain': 0.12},
+    'Pulse': {'harmonics': [1.0], 'attack': 0.001, 'release': 0.02, 'decay': 0.03, 'gain': 0.08},
+}
+
+# part of the dry level taken away at the largest distance
+distanceDimming = 0.6
+
+# nucleotides sonified at a time, their voices are turned into notes before the next ones are sonified
+nucleotidesPerChunk = 1 << 12
+
+# end of the notes still sounding at the end of a chunk, their note off comes in a later one
+openEnd = np.iinfo(np.int64).max // 4
+
+# frequency in Hz of midi notes
+def noteFrequencies(pitches):
+    return 440.0 * 2.0 ** ((np.asarray(pitches, dtype = np.float64) - 69) / 12)
+
+# pair the note ons of a voice with the note off ending them, the next note off of the same pitch
+# events are rows of (tick, status, pitch, velocity) in time order. A note on of a pitch that is already
+# sounding (a closing pseudoknot playing the note of its '[') keeps the note going instead of starting
+# another one, notes never turned off last till endTick
+# returns the start tick, end tick, pitch and velocity of every note, in time order
+def findNotes(events, endTick):
+    if len(events) == 0:
+        return tuple(np.zeros(0, dtype = np.int64) for _ in range(4))
+    isOn = ((events[:, 1] & 0xf0) == 0x90) & (events[:, 3] > 0)
+    isOff = ~isOn & (((events[:, 1] & 0xf0) == 0x80) | ((events[:, 1] & 0xf0) == 0x90))
+
+    # sorted by pitch, then time
+    order = np.lexsort((np.arange(len(events)), events[:, 2]))
+    pitches = events[order, 2]
+    isOn = isOn[order]
+    isOff = isOff[order]
+
+    # drop note ons following another note on of the same pitch with no note off in between
+    lastKind = np.where(isOn, 1, np.where(isOff, 0, -1))
+    rows = np.arange(len(order))
+    lastRow = np.maximum.accumulate(np.where(lastKind >= 0, rows, -1))
+    previous = np.concatenate(([-1], lastRow[:-1]))
+    retriggers = isOn & (previous >= 0) & (pitches == pitches[np.maximum(previous, 0)]) \
+                 & (lastKind[np.maximum(previous, 0)] == 1)
+    isOn &= ~retriggers
+
+    # the first note off at or after each row
+    offRows = np.where(isOff, rows, len(order))
+    nextOff = np.minimum.accumulate(offRows[::-1])[::-1]
+
+    ons = np.flatnonzero(isOn)
+    closing = nextOff[ons]
+    ends = np.full(len(ons), endTick, dtype = np.int64)
+    closed = closing < len(order)
+    closed[closed] = pitches[closing[closed]] == pitches[ons[closed]]
+    ends[closed] = events[order[closing[closed]], 0]
+
+    timeOrder = np.argsort(order[ons], kind = 'stable')
+    rowsOn = order[ons][timeOrder]
+    return (events[rowsOn, 0], ends[timeOrder], events[rowsOn, 2], events[rowsOn, 3])
+
+# smallest length of the form 2^a 3^b 5^c that is at least n, fast to transform
+def fastLength(n):
+    best = 1 << int(np.ceil(np.log2(max(n, 1))))
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            length = power35 << max(int(np.ceil(np.log2(n / power35))), 0)
+            best = min(best, length)
+            power35 *= 3
+        power5 *= 5
+    return best
+
+# values of a control change lane at some ticks, default before its first event
+def laneValues(lane, ticks, default = 64):
+    previous = np.searchsorted(lane[:, 0], ticks, side = 'right') - 1
+    return np.where(previous >= 0, lane[np.maximum(previous, 0), 3], default)
+
+# notes of a voice ready to be synthesized: first and note off samples, frequencies and
+# stereo gains (dry left, dry right, reverb send left, reverb send right) of each note, in time order
+class NoteTable:
+
+    def __init__(self, timbre, starts, ends, frequencies, gains, releaseSamples, windowSamples):
+        self.timbre = timbre
+        self.starts = starts
+        self.ends = ends
+        self.frequencies = frequencies
+        self.gains = gains
+        self.releaseSamples = releaseSamples
+        self.windowSamples = windowSamples
+
+        # notes longer than a window (held pseudoknots) are looked up on their own,
+        # the other ones are found from their start
+        isLong = self.ends - self.starts > windowSamples
+        self.shortNotes = np.flatnonzero(~isLong)
+        self.longNotes = np.flatnonzero(isLong)
+        self.longestShort = int((self.ends - self.starts)[self.shortNotes].max()) if len(self.shortNotes) else 0
+
+    # indices of the notes sounding (or being released) between samples first and last, in order
+    # (notes are mixed in that order, so a window sounds the same whatever notes the table holds)
+    def findSounding(self, first, last):
+        shortStarts = self.starts[self.shortNotes]
+        low = np.searchsorted(shortStarts, first - self.longestShort - self.releaseSamples, side = 'left')
+        high = np.searchsorted(shortStarts, last, side = 'left')
+        notes = np.sort(np.concatenate((self.shortNotes[low:high], self.longNotes)))
+        return notes[(self.starts[notes] < last) & (self.ends[notes] + self.releaseSamples > first)]
+
+    # a table of some of the notes, small enough to be sent to a worker process
+    def select(self, notes):
+        return NoteTable(self.timbre, self.starts[notes], self.ends[notes], self.frequencies[notes],
+                         self.gains[notes], self.releaseSamples, self.windowSamples)
+
+# stereo gains of notes (start ticks and velocities) from the pan and distance lanes
+def noteGains(timbre, starts, velocities, pan, distance, noteLength):
+    # the control changes of a nucleotide are sent at its end, a note takes those of its own nucleotide
+    panValues = laneValues(pan, starts + noteLength) / 127
+    sends = laneValues(distance, starts + noteLength, 0) / 127
+    amplitudes = timbre['gain'] * velocities / 127
+    # equal power pan
+    left = amplitudes * np.cos(panValues * np.pi / 2)
+    right = amplitudes * np.sin(panValues * np.pi / 2)
+    dry = 1 - distanceDimming * sends
+    return np.column_stack((left * dry, right * dry, left * sends, right * sends)).astype(np.float32)
+
+# the notes of a voice, found from the chunks of a structure as they come (see findNotes)
+# notes still sounding at the end of a chunk are carried on to the next one, ended notes are kept
+# till they are released. Notes are numbered in the order of the voice, tables keep that order
+class VoiceNotes:
+
+    def __init__(self, timbre, noteLength, sampleRate, samplesPerTick, windowSamples):
+        self.timbre = timbre
+        self.noteLength = noteLength
+        self.samplesPerTick = samplesPerTick
+        self.windowSamples = windowSamples
+        self.releaseSamples = int(timbre['release'] * sampleRate)
+        self.notesNum = 0
+
+        # note ons of the notes still sounding, with their numbers and gains
+        self.openEvents = np.zeros((0, 4), dtype = np.int64)
+        self.openNumbers = np.zeros(0, dtype = np.int64)
+        self.openGains = np.zeros((0, 4), dtype = np.float32)
+
+        # ended notes: numbers, first and note off samples, frequencies and gains
+        self.numbers = np.zeros(0, dtype = np.int64)
+        self.starts = np.zeros(0, dtype = np.int64)
+        self.ends = np.zeros(0, dtype = np.int64)
+        self.frequencies = np.zeros(0, dtype = np.float64)
+        self.gains = np.zeros((0, 4), dtype = np.float32)
+
+    def toSamples(self, ticks):
+        return np.round(ticks * self.samplesPerTick).astype(np.int64)
+
+    # add the events of a chunk (absolute times), pan and distance are the lanes of the chunk
+    # after the last control change of the chunks before
+    def add(self, events, pan, distance):
+        carried = len(self.openEvents)
+        starts, ends, pitches, velocities = findNotes(np.concatenate((self.openEvents, events)), openEnd)
+        # notes are in the order of their note on, the carried ones first
+        numbers = np.concatenate((self.openNumbers, self.notesNum + np.arange(len(starts) - carried)))
+        self.notesNum += len(starts) - carried
+        gains = np.concatenate((self.openGains, noteGains(self.timbre, starts[carried:], velocities[carried:],
+                                                          pan, distance, self.noteLength)))
+
+        isOpen = ends == openEnd
+        self.openEvents = np.column_stack((starts, np.full(len(starts), 0x90), pitches, velocities))[isOpen]
+        self.openNumbers = numbers[isOpen]
+        self.openGains = gains[isOpen]
+        self.addEnded(numbers[~isOpen], starts[~isOpen], ends[~isOpen], pitches[~isOpen], gains[~isOpen])
+
+    def addEnded(self, numbers, starts, ends, pitches, gains):
+        self.numbers = np.concatenate((self.numbers, numbers))
+        self.starts = np.concatenate((self.starts, self.toSamples(starts)))
+        self.ends = np.concatenate((self.ends, self.toSamples(ends)))
+        self.frequencies = np.concatenate((self.frequencies, noteFrequencies(pitches)))
+        self.gains = np.concatenate((self.gains, gains))
+
+    # the structure is over, notes never turned off last till endTick
+    def finish(self, endTick):
+        self.addEnded(self.openNumbers, self.openEvents[:, 0], np.full(len(self.openEvents), endTick),
+                      self.openEvents[:, 2], self.openGains)
+        self.openEvents = self.openEvents[:0]
+        self.openNumbers = self.openNumbers[:0]
+        self.openGains = self.openGains[:0]
+
+    # drop the ended notes released before sample first
+    def prune(self, first):
+        keep = self.ends + self.releaseSamples > first
+        self.numbers, self.starts, self.ends = self.numbers[keep], self.starts[keep], self.ends[keep]
+        self.frequencies, self.gains = self.frequencies[keep], self.gains[keep]
+
+    # the table of the notes kept, sounding ones last till openEnd
+    def table(self):
+        order = np.argsort(np.concatenate((self.numbers, self.openNumbers)))
+        starts = np.concatenate((self.starts, self.toSamples(self.openEvents[:, 0])))
+        ends = np.concatenate((self.ends, np.full(len(self.openEvents), openEnd)))
+        frequencies = np.concatenate((self.frequencies, noteFrequencies(self.openEvents[:, 2])))
+        gains = np.concatenate((self.gains, self.openGains))
+        return NoteTable(self.timbre, starts[order], ends[order], frequencies[order], gains[order],
+                         self.releaseSamples, self.windowSamples)
+
+# turns the voices of a structure into stereo audio
+class Synthesizer:
+
+    def __init__(self, sampleRate = 44100, secondsPerTick = midiSecondsPerTick, reverbSeconds = 2.0, seed = 0):
+        self.sampleRate = sampleRate
+        self.secondsPerTick = secondsPerTick
+        self.reverbSeconds = reverbSeconds
+        self.seed = seed
+
+        # impulse response of the reverb: stereo noise decaying by 60 dB over reverbSeconds, with unit energy
+        rng = np.random.default_rng(seed)
+        reverbSamples = max(int(reverbSeconds * sampleRate), 1)
+        decay = 10 ** (-3 * np.arange(reverbSamples) / reverbSamples)
+        self.impulseResponse = rng.standard_normal((reverbSamples, 2)) * decay[:, None]
+        self.impulseResponse /= np.sqrt((self.impulseResponse ** 2).sum(axis = 0))
+        self.impulseResponse = self.impulseResponse.astype(np.float32)
+        self.impulseSpectra = {}
+
+    # the windows of windowSamples of the voices of a structure given in chunks (see
+    # createMIDI.Sonifier.iterVoices), yields the first and last samples of each window and the tables
+    # of its notes. A window is made once the chunks reach its end, only the notes that can still
+    # sound are kept
+    def iterWindows(self, voiceChunks, noteLength, windowSamples):
+        samplesPerTick = self.sampleRate * self.secondsPerTick
+        voices = [VoiceNotes(timbres[name], noteLength, self.sampleRate, samplesPerTick, windowSamples)
+                  for name in createMIDI.voiceNames[:3]]
+        # last control change of the pan and distance lanes so far
+        lanes = [np.zeros((0, 4), dtype = np.int64)] * 2
+        endTick = 0
+        first = 0
+
+        def window(last):
+            tables = [notes.table() for notes in voices]
+            for notes in voices:
+                notes.prune(last)
+            return (first, last, [table.select(table.findSounding(first, last)) for table in tables])
+
+        for index, notesNum, chunkVoices in voiceChunks:
+            pan, distance = [np.concatenate((lane, events)) for lane, events in zip(lanes, chunkVoices[3:])]
+            for notes, events in zip(voices, chunkVoices[:3]):
+                notes.add(events, pan, distance)
+            lanes = [pan[-1:], distance[-1:]]
+            endTick = max([endTick] + [int(events[:, 0].max()) for events in chunkVoices if len(events)])
+
+            # the next chunks start at the end of this one, their notes can't sound before it
+            readySample = int(round((index + notesNum) * noteLength * samplesPerTick))
+            while first + windowSamples <= readySample:
+                yield window(first + windowSamples)
+                first += windowSamples
+
+        for notes in voices:
+            notes.finish(endTick)
+        # let the last notes be released
+        lastSample = int(round(endTick * samplesPerTick))
+        lastSample += int(max(timbre['release'] for timbre in timbres.values()) * self.sampleRate)
+        while first < lastSample:
+            yield window(min(first + windowSamples, lastSample))
+            first += windowSamples
+
+    # synthesize the notes of a voice sounding between samples first and last,
+    # adding them to the dry and wet (reverb send) stereo buffers of that window
+    def synthesize(self, table, first, last, dry, wet):
+        timbre = table.timbre
+        sampleRate = self.sampleRate
+        releaseSamples = table.releaseSamples
+        notes = table.findSounding(first, last)
+        if len(notes) == 0:
+            return
+
+        # the samples of every note in the window, one after the other
+        starts = table.starts[notes]
+        segmentStarts = np.maximum(starts, first)
+        segmentEnds = np.minimum(table.ends[notes] + releaseSamples, last)
+        lengths = np.maximum(segmentEnds - segmentStarts, 0)
+        offsets = np.cumsum(lengths) - lengths
+        noteIndex = np.repeat(np.arange(len(notes)), lengths)
+        # samples since the note on and since the note off
+        sinceStart = np.arange(int(lengths.sum())) - np.repeat(offsets - (segmentStarts - starts), lengths)
+        sinceEnd = sinceStart - (table.ends[notes] - starts)[noteIndex]
+
+        # harmonics under the Nyquist frequency, sin(h x) comes from sin((h - 1) x) and sin((h - 2) x)
+        # so only one sine and one cosine are computed per sample. The phase is wrapped to one cycle
+        # before going to single precision, so long notes stay in tune
+        frequencies = table.frequencies[notes]
+        cycles = (frequencies / sampleRate)[noteIndex] * sinceStart
+        phases = (2 * np.pi * (cycles - np.floor(cycles))).astype(np.float32)
+        sine = np.sin(phases)
+        doubleCosine = 2 * np.cos(phases)
+        signal = np.zeros(len(phases), dtype = np.float32)
+        previousSine = np.zeros_like(sine)
+        harmonicSine = sine
+        for harmonic, amplitude in enumerate(timbre['harmonics'], 1):
+            if harmonic > 1:
+                harmonicSine, previousSine = doubleCosine * harmonicSine - previousSine, harmonicSine
+            if amplitude:
+                if harmonic * frequencies.max() < sampleRate / 2:
+                    signal += np.float32(amplitude) * harmonicSine
+                else:
+                    signal += (amplitude * (harmonic * frequencies < sampleRate / 2)).astype(np.float32)[noteIndex] \
+                              * harmonicSine
+
+        # attack, release (and decay) envelope
+        times = sinceStart.astype(np.float32) / np.float32(sampleRate)
+        envelope = np.minimum(times * np.float32(1 / timbre['attack']), 1)
+        envelope *= np.clip(1 - sinceEnd.astype(np.float32) * np.float32(1 / (timbre['release'] * sampleRate)), 0, 1)
+        if timbre['decay']:
+            envelope *= np.exp(times * np.float32(-1 / timbre['decay']))
+        signal *= envelope
+
+        # each note is mixed in with its own pan and reverb send
+        gains = table.gains[notes].astype(np.float32)
+        for note, (offset, length, start) in enumerate(zip(offsets.tolist(), lengths.tolist(),
+                                                            (segmentStarts - first).tolist())):
+            part = signal[offset:offset + length, None]
+            dry[start:start + length] += part * gains[note, :2]
+            wet[start:start + length] += part * gains[note, 2:]
+
+    # convolve the wet buffer of a window with the reverb impulse response,
+    # the reverb is longer than the window by the length of the impulse response minus one
+    def reverberate(self, wet):
+        windowLength = len(wet)
+        reverbLength = len(self.impulseResponse)
+        fftLength = fastLength(windowLength + reverbLength - 1)
+        if fftLength not in self.impulseSpectra:
+            self.impulseSpectra[fftLength] = np.fft.rfft(np.ascontiguousarray(self.impulseResponse.T), fftLength)
+        # channels as rows, so each transform runs over contiguous samples
+        spectra = np.fft.rfft(np.ascontiguousarray(wet.T), fftLength) * self.impulseSpectra[fftLength]
+        return np.fft.irfft(spectra, fftLength)[:, :windowLength + reverbLength - 1].T
+
+    # render the samples first to last of the voices (note tables), with the reverb ringing past last
+    def renderChunk(self, tables, first, last):
+        dry = np.zeros((last - first, 2), dtype = np.float32)
+        wet = np.zeros((last - first, 2), dtype = np.float32)
+        for table in tables:
+            self.synthesize(table, first, last, dry, wet)
+        chunk = self.reverberate(wet)
+        chunk[:last - first] += dry
+        return chunk
+
+    # render the voices of a structure (chunks of createMIDI.Sonifier.iterVoices) in time-aligned chunks
+    # of windowSeconds, yields float stereo blocks. Chunks are rendered across worker processes (one at
+    # a time with workers = 1), each one gets the notes sounding in its chunk, which it synthesizes from
+    # their start so held notes go on with the same phase, and returns the chunk with its reverb tail.
+    # Tails are overlap-added to the next chunks, so chunks stitch without clicks. At most two chunks
+    # per worker are in memory at once
+    def iterAudio(self, voiceChunks, noteLength, windowSeconds = 5.0, workers = 1):
+        windowSamples = max(int(windowSeconds * self.sampleRate), 1)
+        windows = self.iterWindows(voiceChunks, noteLength, windowSamples)
+
+        # worker processes are only started for more than one chunk
+        firstWindows = list(itertools.islice(windows, 2))
+        windows = itertools.chain(firstWindows, windows)
+        if workers == 1 or len(firstWindows) < 2:
+            chunks = ((first, last, self.renderChunk(tables, first, last)) for first, last, tables in windows)
+        else:
+            chunks = self.iterParallelChunks(windows, workers)
+
+        tail = np.zeros((len(self.impulseResponse) - 1, 2), dtype = np.float32)
+        for first, last, chunk in chunks:
+            chunk[:len(tail)] += tail
+            tail = chunk[last - first:]
+            yield chunk[:last - first]
+
+        # the reverb rings on after the last note
+        yield tail
+
+    # render windows (see iterWindows) in worker processes, yields their bounds and chunks in order
+    def iterParallelChunks(self, windows, workers):
+        with concurrent.futures.ProcessPoolExecutor(max_workers = workers, initializer = startWorker,
+                                                    initargs = (self.sampleRate, self.secondsPerTick,
+                                                                self.reverbSeconds, self.seed)) as executor:
+            maxPending = 2 * (workers or os.cpu_count() or 1)
+            pending = collections.deque()
+            for first, last, tables in windows:
+                pending.append((first, last, executor.submit(renderWorkerChunk, tables, first, last)))
+                if len(pending) >= maxPending:
+                    first, last, future = pending.popleft()
+                    yield (first, last, future.result())
+            while pending:
+                first, last, future = pending.popleft()
+                yield (first, last, future.result())
+
+    # render the voices of a structure (chunks of createMIDI.Sonifier.iterVoices) to a 16 bit stereo
+    # WAV file, returns its length in seconds
+    def writeWav(self, filename, voiceChunks, noteLength, windowSeconds = 5.0, workers = 1):
+        samplesNum = 0
+        with wave.open(filename, 'wb') as f:
+            f.setnchannels(2)
+            f.setsampwidth(2)
+            f.setframerate(self.sampleRate)
+            for block in self.iterAudio(voiceChunks, noteLength, windowSeconds, workers):
+                f.writeframes(toPCM(block))
+                samplesNum += len(block)
+        return samplesNum / self.sampleRate
+
+# synthesizer of a worker process, created once when the worker starts
+workerSynthesizer = None
+
+def startWorker(sampleRate, secondsPerTick, reverbSeconds, seed):
+    global workerSynthesizer
+    workerSynthesizer = Synthesizer(sampleRate, secondsPerTick, reverbSeconds, seed)
+
+def renderWorkerChunk(tables, first, last):
+    return workerSynthesizer.renderChunk(tables, first, last)
+
+# 16 bit samples of a float stereo block, soft clipped instead of wrapping around
+def toPCM(block):
+    return (np.tanh(block) * 32767).astype('<i2').tobytes()
+
+# the sonifier and the synthesizer of a render
+def createRenderers(scale, key, seed, nucleotideSeconds, sampleRate):
+    sonifier = createMIDI.Sonifier(scale, key, seed = seed)
+    secondsPerTick = midiSecondsPerTick if nucleotideSeconds is None else nucleotideSeconds / sonifier.noteLength
+    return (sonifier, Synthesizer(sampleRate, secondsPerTick))
+
+# sonify a CSSD string (or StructureIndex) and render it to a WAV file, returns its length in seconds
+def renderAudio(wuss, filename, scale = 'Minor', key = 0, seed = None, nucleotideSeconds = None,
+                sampleRate = 44100, windowSeconds = 5.0, workers = 1):
+    sonifier, synthesizer = createRenderers(scale, key, seed, nucleotideSeconds, sampleRate)
+    return synthesizer.writeWav(filename, sonifier.iterVoices(wuss, chunkSize = nucleotidesPerChunk),
+                                sonifier.noteLength, windowSeconds, workers)
+
+# same as renderAudio for a structure file, streamed without holding the structure in memory
+def renderAudioFile(structureFilename, filename, scale = 'Minor', key = 0, seed = None, nucleotideSeconds = None,
+                    sampleRate = 44100, windowSeconds = 5.0, workers = 1):
+    sonifier, synthesizer = createRenderers(scale, key, seed, nucleotideSeconds, sampleRate)
+    return synthesizer.writeWav(filename, sonifier.iterFileVoices(structureFilename, chunkSize = nucleotidesPerChunk),
+                                sonifier.noteLength, windowSeconds, workers)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Render an RNA secondary structure in CSSD format to a WAV file')
+    parser.add_argument('structure', help = "name of a .txt file in 'RNA structures', or the path of a structure file")
+    parser.add_argument('-o', '--output', default = None, help = "WAV file to save (default: 'audio/<name>.wav')")
+    parser.add_argument('--scale', default = 'Minor', help = 'scale of the notes')
+    parser.add_argument('--key', type = int, default = None, help = 'key (0-11) of the notes (default: random)')
+    parser.add_argument('--seed', type = int, default = None, help = 'seed of the random choices, to reproduce a render')
+    parser.add_argument('--nucleotide-seconds', type = float, default = None,
+                        help = 'length of a nucleotide in seconds (default: as in the MIDI files, 0.125)')
+    parser.add_argument('--sample-rate', type = int, default = 44100, help = 'sample rate in Hz (default: 44100)')
+    parser.add_argument('--window', type = float, default = 5.0,
+                        help = 'seconds of audio rendered at a time by a worker (default: 5)')
+    parser.add_argument('-j', '--workers', type = int, default = None,
+                        help = 'number of worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+
+    filename = args.structure
+    if not os.path.exists(filename):
+        filename = os.path.join('RNA structures', args.structure + '.txt')
+    name = os.path.splitext(os.path.basename(filename))[0]
+    output = args.output or os.path.join('audio', name + '.wav')
+    if os.path.dirname(output) and not os.path.exists(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+
+    # independent random streams for the key and the sonifier, like createMIDI.py
+    choicesSeed, sonifierSeed = np.random.SeedSequence(args.seed).spawn(2)
+    key = int(np.random.default_rng(choicesSeed).integers(0, 12)) if args.key is None else args.key
+
+    try:
+        seconds = renderAudioFile(filename, output, args.scale, key, sonifierSeed, args.nucleotide_seconds,
+                                  args.sample_rate, args.window, args.workers)
+    except structureIndex.StructureError as error:
+        print('Invalid structure: %s' % error, file = sys.stderr)
+        sys.exit(1)
+    print('Saved %s (%.1f s of audio)' % (output, seconds))
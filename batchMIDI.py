@@ -0,0 +1,199 @@
+'''
+Input arguments: directories or glob patterns of RNA structures to sonify
+-Create the MIDI files of every structure found, rendering them in parallel
+-Each structure <name>.txt is saved as <name>.mid and <name>PKs.mid in the output directory,
+ or as a single multi-track <name>.mid with --single-file
+-Stockholm (.sto, .stk, .seed) and Vienna / FASTA (.fa, .db, .dbn) files, gzipped or not, hold
+ many structures: their records are read one at a time, converted to CSSD and each one is saved
+ under its record name (see structureFormats.py)
+-Print the time spent on each file and a throughput summary
+-Use --seed to reproduce a batch, each file gets its own random stream whatever worker renders it
+-Use --cache <directory> to reuse the MIDI files of structures rendered before with the same parameters
+'''
+
+import os
+import re
+import sys
+import glob
+import time
+import argparse
+import concurrent.futures
+import numpy as np
+import createMIDI
+import midiCache
+import structureFormats
+
+# expand directories and glob patterns into a sorted list of structure files
+# (in directories, the .txt structures and the Stockholm / Vienna record files)
+def findStructureFiles(inputs):
+    filenames = []
+    for pattern in inputs:
+        found = glob.glob(pattern)
+        if os.path.isdir(pattern):
+            found = [filename for filename in glob.glob(os.path.join(pattern, '*'))
+                     if filename.endswith('.txt') or structureFormats.isRecordFile(filename)]
+        for filename in sorted(found):
+            # skip the readme files kept in the structure folders
+            if os.path.basename(filename).lower() != 'readme.txt' and filename not in filenames:
+                filenames.append(filename)
+    return filenames
+
+# caches opened by this process, so the cache directory is scanned once per worker
+openCaches = {}
+
+# sonify one structure file and save its midi files as <name>.mid, runs in a worker process
+# returns the number of nucleotides, the time spent and whether the files came from the cache
+def renderFile(filename, name, outputDir, scale, key, singleFile = False, cacheDir = None, cacheSize = 256 << 20,
+               seed = None):
+    start = time.perf_counter()
+
+    f = open(filename, 'r')
+    wuss = ''.join(f.read().split())
+    f.close()
+
+    return renderStructure(wuss, name, outputDir, scale, key, singleFile, cacheDir, cacheSize, seed, start)
+
+# convert one record of a Stockholm / Vienna file to CSSD, then sonify it like renderFile
+def renderRecord(structure, converter, name, outputDir, scale, key, singleFile = False, cacheDir = None,
+                 cacheSize = 256 << 20, seed = None):
+    start = time.perf_counter()
+    return renderStructure(converter(structure), name, outputDir, scale, key, singleFile, cacheDir, cacheSize,
+                           seed, start)
+
+# sonify a structure (CSSD string or StructureIndex) and save its midi files as <name>.mid
+def renderStructure(wuss, name, outputDir, scale, key, singleFile, cacheDir, cacheSize, seed, start):
+    cache = None
+    cached = False
+    if cacheDir:
+        if (cacheDir, cacheSize) not in openCaches:
+            openCaches[(cacheDir, cacheSize)] = midiCache.MidiCache(cacheDir, cacheSize)
+        cache = openCaches[(cacheDir, cacheSize)]
+        hits = cache.hits
+
+    sonifier = createMIDI.Sonifier(scale, key, seed = seed)
+    for suffix, data in zip(('.mid', 'PKs.mid'), sonifier.renderMidiFiles(wuss, singleFile, cache)):
+        with open(os.path.join(outputDir, name + suffix), 'wb') as f:
+            f.write(data)
+
+    if cache is not None:
+        cached = cache.hits > hits
+    return (len(wuss), time.perf_counter() - start, cached)
+
+# characters kept in the names of the midi files of records
+unsafeName = re.compile(r'[^\w.-]+')
+
+# the name of the midi files of a structure, numbered if a structure of the batch already took it
+# (files with the same name in different directories, records with the same name). names holds
+# the names of the files saved, <name> and <name>PKs for each structure
+def uniqueName(name, names):
+    name = unsafeName.sub('_', name).strip('._') or 'structure'
+    unique = name
+    copies = 1
+    while unique in names or unique + 'PKs' in names:
+        copies += 1
+        unique = '%s_%d' % (name, copies)
+    names.update((unique, unique + 'PKs'))
+    return unique
+
+# the jobs of a batch, one per .txt file and one per record of the record files, made lazily
+# yields (label, function, arguments) with the key and seed of each job
+def iterJobs(filenames, outputDir, scale, key, singleFile, cacheDir, cacheSize, seed):
+    # keys are chosen here, and every file gets an independent seed in the order of the files,
+    # so the output doesn't depend on which worker renders which file.
+    # The records of a file get seeds spawned in turn from the seed of their file.
+    # Without a seed, jobs get no seed at all so their renders are never cached
+    keySeed, *fileSeeds = np.random.SeedSequence(seed).spawn(len(filenames) + 1)
+    rng = np.random.default_rng(keySeed)
+
+    names = set()
+    for filename, fileSeed in zip(filenames, fileSeeds):
+        if not structureFormats.isRecordFile(filename):
+            fileKey = int(rng.integers(0, 12)) if key is None else key
+            name = uniqueName(os.path.splitext(os.path.basename(filename))[0], names)
+            yield (filename, renderFile,
+                   (filename, name, outputDir, scale, fileKey, singleFile, cacheDir, cacheSize,
+                    fileSeed if seed is not None else None))
+            continue
+
+        for recordName, structure, converter in structureFormats.iterRawRecords(filename):
+            recordKey = int(rng.integers(0, 12)) if key is None else key
+            yield ('%s:%s' % (filename, recordName), renderRecord,
+                   (structure, converter, uniqueName(recordName, names), outputDir, scale, recordKey, singleFile,
+                    cacheDir, cacheSize, fileSeed.spawn(1)[0] if seed is not None else None))
+
+# render all files across a process pool, returns the number of failed structures
+# jobs are submitted a few at a time, so record files of any size are never held in memory
+def renderBatch(filenames, outputDir, scale = 'Minor', key = None, workers = None, singleFile = False,
+                cacheDir = None, cacheSize = 256 << 20, seed = None):
+    if not os.path.exists(outputDir):
+        os.makedirs(outputDir)
+
+    start = time.perf_counter()
+    totalNucl = 0
+    failed = 0
+    cachedFiles = 0
+    jobsNum = 0
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+        maxPending = 4 * (workers or os.cpu_count() or 1)
+        futures = {}
+
+        def collect(done):
+            nonlocal failed, totalNucl, cachedFiles
+            for future in done:
+                label = futures.pop(future)
+                try:
+                    notesNum, seconds, cached = future.result()
+                except Exception as error:
+                    failed += 1
+                    print('%s: failed (%s: %s)' % (label, type(error).__name__, error))
+                    continue
+                totalNucl += notesNum
+                cachedFiles += cached
+                print('%s: %d nucleotides in %.3f s%s' % (label, notesNum, seconds, ' (cached)' if cached else ''))
+
+        for label, function, arguments in iterJobs(filenames, outputDir, scale, key, singleFile,
+                                                    cacheDir, cacheSize, seed):
+            if len(futures) >= maxPending:
+                done, _ = concurrent.futures.wait(futures, return_when = concurrent.futures.FIRST_COMPLETED)
+                collect(done)
+            futures[executor.submit(function, *arguments)] = label
+            jobsNum += 1
+
+        collect(concurrent.futures.as_completed(list(futures)))
+
+    elapsed = time.perf_counter() - start
+    rendered = jobsNum - failed
+    print('Rendered %d of %d structures (%d nucleotides) in %.3f s' % (rendered, jobsNum, totalNucl, elapsed))
+    if elapsed > 0:
+        print('Throughput: %.1f structures/s, %.0f nucleotides/s' % (rendered / elapsed, totalNucl / elapsed))
+    if cacheDir:
+        print('MIDI cache: %d hits, %d misses' % (cachedFiles, rendered - cachedFiles))
+
+    return failed
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Sonify a batch of RNA secondary structures in parallel')
+    parser.add_argument('inputs', nargs = '*', default = ['RNA structures'],
+                        help = "directories or glob patterns of .txt structures or Stockholm / Vienna files "
+                             "(default: 'RNA structures')")
+    parser.add_argument('-o', '--output', default = 'MIDI files', help = 'directory the midi files are saved to')
+    parser.add_argument('-j', '--workers', type = int, default = None,
+                        help = 'number of worker processes (default: number of CPUs)')
+    parser.add_argument('--scale', default = 'Minor', help = 'scale used for every structure')
+    parser.add_argument('--key', type = int, default = None, help = 'key (0-11) used for every structure (default: random)')
+    parser.add_argument('--single-file', action = 'store_true', help = 'save one multi-track MIDI file per structure')
+    parser.add_argument('--seed', type = int, default = None, help = 'seed of the random choices, to reproduce a batch')
+    parser.add_argument('--cache', default = None, help = 'directory of a cache of rendered MIDI files')
+    parser.add_argument('--cache-size', type = float, default = 256, help = 'size cap of the cache in MB (default: 256)')
+    args = parser.parse_args()
+
+    filenames = findStructureFiles(args.inputs)
+    if not filenames:
+        print('No structure files found')
+        sys.exit(1)
+
+    failed = renderBatch(filenames, args.output, args.scale, args.key, args.workers, args.single_file,
+                         args.cache, int(args.cache_size * (1 << 20)), args.seed)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,203 @@
+'''
+Benchmark the generation and sonification hot paths
+-Sweeps structure length (10^2 to 10^6 nucleotides), number of hairpin loops and pseudoknot presence
+ over random structures, then runs every structure of 'RNA structures'
+-Times each stage separately: createRandomRNAstructure, findDistances, the note walk
+ (compile and emit of the midi events) and the MIDI save
+-Reports throughput (nucleotides/s, events/s) and peak memory of each stage as JSON,
+ to compare versions and catch regressions
+-Times the startup of a file-only createMIDI.py run against a budget (on top of the time python takes
+ to import numpy), and checks it never loads the MIDI backend
+'''
+
+import os
+import io
+import sys
+import time
+import json
+import platform
+import argparse
+import subprocess
+import tempfile
+import tracemalloc
+import contextlib
+import numpy as np
+import randomRNA
+import midiWriter
+import createMIDI
+import batchMIDI
+import structureFormats
+
+# run a stage repeat times, returns its result and the best time in seconds
+def timeStage(stage, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = stage()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return (result, best)
+
+# peak memory allocated while running a stage once, in bytes
+# it is measured in a separate run, since tracing allocations slows the stage down
+def peakMemory(stage):
+    tracemalloc.start()
+    try:
+        stage()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+# time and measure a stage, with its throughput per nucleotide (and per event if it emits events)
+def measureStage(stage, notesNum, repeat, eventsNum = None):
+    result, seconds = timeStage(stage, repeat)
+    measures = {'seconds': seconds, 'peakBytes': peakMemory(stage)}
+    if seconds > 0:
+        measures['nucleotidesPerSecond'] = notesNum / seconds
+    if eventsNum is not None:
+        measures['events'] = eventsNum(result)
+        if seconds > 0:
+            measures['eventsPerSecond'] = measures['events'] / seconds
+    return (result, measures)
+
+# benchmark findDistances, the note walk and the save of a structure
+def benchmarkStructure(wuss, repeat, seed):
+    stages = {}
+    notesNum = len(wuss)
+
+    distances, stages['findDistances'] = measureStage(lambda: randomRNA.findDistances(wuss), notesNum, repeat)
+
+    sonifier = createMIDI.Sonifier('Minor', 0, seed = seed)
+    tracks, stages['noteWalk'] = measureStage(lambda: sonifier.sonifyEvents(wuss, distances), notesNum, repeat,
+                                              lambda tracks: sum(len(events) for events in tracks))
+
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = [os.path.join(directory, name) for name in ('main.mid', 'pk.mid')]
+        def save():
+            for filename, events in zip(filenames, tracks):
+                midiWriter.writeMidiFile(filename, [events])
+        _, stages['save'] = measureStage(save, notesNum, repeat, lambda _: sum(len(events) for events in tracks))
+        stages['save']['bytes'] = sum(os.path.getsize(filename) for filename in filenames)
+
+    return stages
+
+# benchmark random structures of every length, number of loops and pseudoknot presence
+def benchmarkRandom(lengths, loops, repeat, seed):
+    cases = []
+    for numberOfNucl in lengths:
+        for numberOfLoops in loops:
+            for pseudoknot in ((False, True) if numberOfLoops > 1 else (False,)):
+                # the structure is printed by createRandomRNAstructure, which is part of what is timed
+                def generate():
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        return randomRNA.createRandomRNAstructure(numberOfNucl, numberOfLoops, seed, pseudoknot)
+                (wuss, madeLoops), generateStage = measureStage(generate, numberOfNucl, repeat)
+
+                case = {'source': 'randomRNA', 'length': numberOfNucl, 'loops': madeLoops,
+                        'pseudoknot': '[' in wuss, 'stages': {'createRandomRNAstructure': generateStage}}
+                case['stages'].update(benchmarkStructure(wuss, repeat, seed))
+                cases.append(case)
+                printCase(case)
+    return cases
+
+# benchmark the structure files found in inputs, every record of the Stockholm / Vienna files
+def benchmarkFiles(inputs, repeat, seed):
+    cases = []
+    for filename in batchMIDI.findStructureFiles(inputs):
+        if structureFormats.isRecordFile(filename):
+            records = [('%s:%s' % (filename, name), structure.wuss)
+                       for name, structure in structureFormats.iterStructureRecords(filename)]
+        else:
+            # wrapped structures are read like createMIDI does, without their line breaks
+            f = open(filename, 'r')
+            records = [(filename, ''.join(f.read().split()))]
+            f.close()
+        for source, wuss in records:
+            if not wuss:
+                continue
+            case = {'source': source, 'length': len(wuss), 'pseudoknot': '[' in wuss,
+                    'stages': benchmarkStructure(wuss, repeat, seed)}
+            cases.append(case)
+            printCase(case)
+    return cases
+
+# time a file-only render of a small structure may take on top of starting python and importing numpy
+startupBudget = 0.06
+# modules only live output needs, a file-only render must not import them
+liveModules = ('mido', 'rtmidi', 'playback', 'portManager')
+
+# best time of running a command repeat times, in seconds
+def timeCommand(command, repeat, cwd = None):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd = cwd, check = True, stdout = subprocess.DEVNULL)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+# benchmark the startup of createMIDI.py rendering a small structure to files (--offline),
+# in a temporary directory so the repository files are left alone
+def benchmarkStartup(repeat, seed):
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, 'RNA structures'))
+        wuss, _ = randomRNA.createRandomRNAstructure(150, 2, seed, verbose = False)
+        with open(os.path.join(directory, 'RNA structures', 'startup.txt'), 'w') as f:
+            f.write(wuss)
+        command = [sys.executable, os.path.abspath(createMIDI.__file__), 'startup', '--offline', '--quiet',
+                   '--seed', str(seed)]
+
+        numpySeconds = timeCommand([sys.executable, '-c', 'import numpy'], repeat)
+        seconds = timeCommand(command, repeat, directory)
+
+        # modules imported by the run, from the -X importtime log
+        log = subprocess.run([sys.executable, '-X', 'importtime'] + command[1:], cwd = directory, check = True,
+                             stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, text = True).stderr
+        modules = {line.split('|')[-1].strip() for line in log.splitlines() if line.startswith('import time:')}
+
+    startup = {'seconds': seconds, 'numpySeconds': numpySeconds, 'overheadSeconds': seconds - numpySeconds,
+               'budgetSeconds': startupBudget, 'withinBudget': seconds - numpySeconds <= startupBudget,
+               'liveModules': sorted(name for name in modules if name.split('.')[0] in liveModules)}
+    print('startup: %.4f s (%.4f s over importing numpy, budget %.4f s)%s'
+          % (seconds, startup['overheadSeconds'], startupBudget,
+             '' if startup['withinBudget'] else ' OVER BUDGET'), file = sys.stderr)
+    if startup['liveModules']:
+        print('startup: file-only render imported %s' % ', '.join(startup['liveModules']), file = sys.stderr)
+    return startup
+
+# one line summary of a case, on stderr so stdout only holds the JSON report
+def printCase(case):
+    times = ', '.join('%s %.4f s' % (name, stage['seconds']) for name, stage in case['stages'].items())
+    print('%s %d nt: %s' % (case['source'], case['length'], times), file = sys.stderr)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Benchmark structure generation and sonification')
+    parser.add_argument('-o', '--output', default = None, help = 'file the JSON report is saved to (default: stdout)')
+    parser.add_argument('--lengths', type = int, nargs = '+', default = [10**2, 10**3, 10**4, 10**5, 10**6],
+                        help = 'lengths of the random structures (default: 10^2 to 10^6)')
+    parser.add_argument('--loops', type = int, nargs = '+', default = [1, 3, 10],
+                        help = 'numbers of hairpin loops of the random structures (default: 1 3 10)')
+    parser.add_argument('--inputs', nargs = '*', default = ['RNA structures'],
+                        help = "directories or glob patterns of structure files (default: 'RNA structures')")
+    parser.add_argument('--repeat', type = int, default = 3, help = 'runs of each stage, the best time is kept')
+    parser.add_argument('--seed', type = int, default = 0, help = 'seed of the random structures and notes')
+    args = parser.parse_args()
+
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'startup': benchmarkStartup(args.repeat, args.seed),
+        'cases': benchmarkRandom(args.lengths, args.loops, args.repeat, args.seed)
+                 + benchmarkFiles(args.inputs, args.repeat, args.seed),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent = 1)
+    else:
+        json.dump(report, sys.stdout, indent = 1)
+        print()
@@ -1,6 +1,26 @@
 '''
 Input arguments: filename of RNA structure to sonify
 -Create MIDI data to sonify the generated structure
+-Use --offline to render the MIDI files only, without opening a MIDI port
+-Import Sonifier to sonify many structures from one process
+-Use --stream to read long structures in chunks and write the MIDI files as they are created
+-Structures are compiled to run-length segments of nucleotides played the same way,
+ then the midi events of the segments are emitted in bulk
+-Use --single-file to save one multi-track MIDI file with a track per voice instead of two files
+-Use --cc-changes-only to only send pan and distance control changes when their value changes,
+ --cc-interval <ticks> to also limit their rate
+-Use --quiet to drop the printed notes, --profile <file.json> to save the time spent in each stage
+ and counts of the emitted events, --cprofile <file> to save cProfile statistics
+-Use --seed to reproduce a run: every random choice comes from generators created from the seed
+-Use --cache <directory> to reuse the MIDI files of a structure rendered before with the same parameters
+-Pseudoknots are matched with the pair table of the structure, each ']' plays and turns off
+ the note of its own '[', however many pseudoknots are open or interleaved
+-Live playback to the MIDI port is scheduled against a monotonic clock (see playback.py),
+ use --playback-thread to play from a dedicated thread while the structure is rendered
+-Use --port 'name=channels' (several times) to send channels to different MIDI ports, messages are
+ sent from a thread per port so a slow port never holds up the render (see portManager.py)
+-mido and playback.py are only imported for live output (and mido tracks), midiCache.py only with
+ a cache, so a file-only render (--offline) starts fast and never loads a MIDI backend or looks for ports
 
 MIDI port channels (0-16) routing:
 0: main melody pitch, midi CCs
@@ -12,14 +32,35 @@ MIDI port channels (0-16) routing:
 
 import os
 import sys
-import mido
-import time
-import math
-import random
+import heapq
+import argparse
+import functools
+import itertools
+import numpy as np
+import profiling
+import structureIndex
 import randomRNA
+import midiWriter
+
+# note names of each pitch class
+noteNames = {0:'C', 1:'Db', 2:'D', 3:'Eb', 4:'E', 5:'F', 6:'Gb', 7:'G', 8:'Ab', 9:'A', 10:'Bb', 11:'B'}
+
+# strategies calculating the next note to be inputed in midi track
+strategies = {'(': 'Up', '<': 'Up', ')': 'Down', '>': 'Down', '_': 'Pause', ':': 'Pause',
+                '-' :'Stable', ',': 'Disharmony', '[': 'Pseudoknot', ']': 'Pseudoknot'}
+
+# play modes of compiled nucleotides, pseudoknots are split depending on how their note moves
+playModes = ['Up', 'Down', 'Stable', 'Pause', 'Disharmony', 'Pseudoknot Up', 'Pseudoknot Stable', 'Pseudoknot Down']
+# notes added to the played note
+chordTypes = ['None', 'Interior Loop', 'Helix']
+
+# play mode of each CSSD character, -1 for characters out of the CSSD alphabet
+modeLookup = np.full(256, -1, dtype = np.int64)
+for char, strategy in strategies.items():
+    modeLookup[ord(char)] = playModes.index(strategy if strategy != 'Pseudoknot' else 'Pseudoknot Up')
 
 # defines which notes of each octave will be allowed to play
-def selectNotes(scale = 'Minor', key = 0):
+def selectNotes(scale = 'Minor', key = 0, verbose = True):
     scales = {
         'Chromatic': [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11],
         'Major': [0, 2, 4, 5, 7, 9, 11],
@@ -29,10 +70,11 @@ def selectNotes(scale = 'Minor', key = 0):
         'Whole Tone': [0, 2, 4, 6, 8, 10],
         'Hirajoshi': [0, 2, 3, 7, 8] # according to Kostka & Payne
     }
-    
+
     notes = scales[scale]
     notes = transposeScale(notes,key)
-    print('Scale:', noteNames[key], scale)
+    if verbose:
+        print('Scale:', noteNames[key], scale)
     return(notes)
 
 # transpose note list l to key C+step(0-11)
@@ -45,67 +87,8 @@ def transposeScale(l, step):
         transposed.append(note)
     return transposed
 
-# adds a note to midi track
-def inputNote(notes, note, octave, noteLength, willNotePlay, intervals, sendToPort):
-
-    # send pulse
-    if sendToPort:
-        port.send(mido.Message('note_on', note = 60, channel = 2))
-    
-    # send main melody velocity to channel 3
-    if willNotePlay:
-        port.send(mido.Message('note_on', velocity = 127, channel = 3))
-    else:
-        port.send(mido.Message('note_off', velocity = 0, channel = 3))
-
-    if willNotePlay:
-        noteToInput = min(note + octave*12, 127)
-
-        # add note to midi track and send it to midi port
-        midiTrack.append(mido.Message('note_on', note = noteToInput))
-        if sendToPort:
-            port.send(mido.Message('note_on', note = noteToInput))
-
-        # keep a list with the added notes (values 0-127)
-        notesAdded = [-1] * len(intervals)
-        for index in range(len(intervals)):
-            interval = intervals[index]
-            if interval != 0:
-                # find the note in scale
-                notesAdded[index] = findIncriment(notes, note, octave, noteLength, interval)
-                # add note to midi track and send it to midi port
-                midiTrack.append(mido.Message('note_on', note = notesAdded[index]))
-                if sendToPort:
-                    port.send(mido.Message('note_on', note = notesAdded[index]))
-
-        if sendToPort:
-            time.sleep(sendToPort)
-
-        # send note off messages
-        midiTrack.append(mido.Message('note_off', note = noteToInput, time = noteLength))
-        if sendToPort:
-            port.send(mido.Message('note_off', note = noteToInput, time = noteLength))
-        # send note off messages for all intevals
-        for index in range(len(notesAdded)):
-            # if a note was added
-            if notesAdded[index] >= 0:
-                midiTrack.append(mido.Message('note_off', note = notesAdded[index]))
-                if sendToPort:
-                    port.send(mido.Message('note_off', note = notesAdded[index]))
-
-        noteToString = noteNames[noteToInput - octave*12] + str(octave)
-    else:
-        # input pause in midi track
-        midiTrack.append(mido.Message('note_off', time = noteLength))
-        if sendToPort:
-            time.sleep(sendToPort)
-        noteToString = '-'
-
-    print(noteToString, end = ' ')
-    return noteToString
-
 # find incremented note depending on the step and the root note
-def findIncriment(notes, note, octave, noteLength, step):
+def findIncriment(notes, note, octave, step):
     if abs(step) >= len(notes):
         if step > 0:
             octave += int(step/len(notes))
@@ -124,42 +107,227 @@ def findIncriment(notes, note, octave, noteLength, step):
         octave += 1
     if note < notes[noteToInput] and step < 0: # negative step
         octave -= 1
-        
-    noteToInput = min(notes[noteToInput] + octave*12, 127)      
+
+    noteToInput = min(notes[noteToInput] + octave*12, 127)
 
     return (noteToInput)
 
-# append midi message to midi track and send it to midi port
-def sendQuickMessage(message, port):
-    midiTrack.append(message)
-    if port:
-        port.send(message)
-
-# initialize midi track, midi file and midi port
-def initializeMido():
-
-    sendToPort = 0.01 # float(input('Select live playspeed to midi port in seconds per note (float from 0 to 1): '))
-
-    # create midi track
-    midiTrack = mido.MidiTrack()
-    
-    # create midi file containing the above midi track
-    theMidiFile = mido.MidiFile()
-    theMidiFile.tracks.append(midiTrack)
-    
-    # create midi port to directly send midi data
+# open the midi ports to directly send midi data
+# sendToPort is the live playspeed in seconds per note, 0 renders offline
+# without opening a midi port or waiting
+# routes are 'name' or 'name=channels' strings (see portManager.parseRoutes), by default every
+# channel goes to 'loopMIDI Port 1'. Ports that are not available are picked among the open ones
+def initializeMido(sendToPort = 0.01, routes = None):
+
     port = 0
     if  sendToPort:
-        # default port to look into
-        port = 'loopMIDI Port 1'
-        # if that port is not available
-        while port not in mido.get_output_names():
-            print('Select one of the following ports available to send MIDI data:')
-            print(mido.get_output_names())
-            port = input()
-        port = mido.open_output(port)
-    
-    return (sendToPort, midiTrack, port, theMidiFile)
+        import portManager
+        routes = portManager.parseRoutes(routes or [portManager.defaultPort])
+        port = portManager.FanOutPort(portManager.pickMissingPorts(routes))
+
+    return (sendToPort, port)
+
+# read a structure file in chunks, dropping the line breaks of wrapped structures
+def iterStructureFile(filename, chunkSize = 1 << 16):
+    with open(filename, 'r') as f:
+        while True:
+            chunk = f.read(chunkSize)
+            if not chunk:
+                break
+            chunk = ''.join(chunk.split())
+            if chunk:
+                yield chunk
+
+# last nucleotide of a structure file, read from the end of the file
+def lastNucleotide(filename, chunkSize = 1 << 10):
+    with open(filename, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - chunkSize)
+            f.seek(start)
+            chunk = f.read(end - start).rstrip()
+            if chunk:
+                return chr(chunk[-1])
+            end = start
+    return ''
+
+# convert rows of (delta time, status, data 1, data 2) events to mido messages
+def eventsToMessages(events):
+    import mido
+    messages = []
+    for delta, status, data1, data2 in events.tolist():
+        if status == 0xb0:
+            messages.append(mido.Message('control_change', control = data1, value = data2, time = delta,
+                                         skip_checks = True))
+        else:
+            messages.append(mido.Message('note_on' if status == 0x90 else 'note_off', note = data1,
+                                         velocity = data2, time = delta, skip_checks = True))
+    return messages
+
+# voices of the single midi file output, one track each
+# midi CC 21: pan, sequence index mapped linearly to 0-1 and transformed to sigmoid (scale factor 10)
+# first and last nucleotides are panned all the way, values are remapped to 0-127
+def findPanValues(nucleotides, notesNum):
+    panValues = 1 / (1 + np.exp(-10*(nucleotides / notesNum - 0.5)))
+    # the first nucleotide is checked last, it is the last one too in a structure of one nucleotide
+    panValues[nucleotides == notesNum - 1] = 1
+    panValues[nucleotides == 0] = 0
+    return np.rint(panValues * 127).astype(np.int64)
+
+# the pan curve of a whole sequence, as the first nucleotide of each pan value 1-127
+# the curve never goes down, so it is found with a binary search of all values at once and
+# the pan of any nucleotide is the number of values it reached: np.searchsorted(curve, nucleotide, 'right')
+@functools.lru_cache(maxsize = 16)
+def findPanCurve(notesNum):
+    values = np.arange(1, 128)
+    low = np.zeros(len(values), dtype = np.int64)
+    high = np.full(len(values), notesNum, dtype = np.int64)
+    while (low < high).any():
+        middle = (low + high) // 2
+        reached = findPanValues(np.minimum(middle, notesNum - 1), notesNum) >= values
+        reached &= middle < notesNum
+        high = np.where(reached, middle, high)
+        low = np.where(reached, low, middle + 1)
+    return low
+
+# drop the control changes of emitted events that don't change the value of their controller
+# lastValues maps each controller to its last (value, tick) sent and is updated, minInterval is the
+# least number of ticks between two control changes of a controller (0 for no rate limit), a value
+# coming faster is held back and sent by the first control change once the interval has elapsed.
+# isLast is set for the last events of the structure, a value still held back is sent by the last
+# control change. Returns the events and the updated number of events of each nucleotide
+def thinControlChanges(mainEvents, mainCounts, firstTick, noteLength, lastValues, minInterval = 0, isLast = False):
+    isCC = mainEvents[:, 1] == 0xb0
+    ccRows = np.flatnonzero(isCC)
+    nucleotides = np.repeat(np.arange(len(mainCounts)), mainCounts)
+    keep = np.ones(len(mainEvents), dtype = bool)
+
+    for controller in np.unique(mainEvents[ccRows, 2]).tolist():
+        rows = ccRows[mainEvents[ccRows, 2] == controller]
+        values = mainEvents[rows, 3]
+        lastValue, lastTick = lastValues.get(controller, (None, None))
+        if minInterval <= 0:
+            previous = np.empty_like(values)
+            previous[0] = -1 if lastValue is None else lastValue
+            previous[1:] = values[:-1]
+            keep[rows] = values != previous
+            lastValues[controller] = (int(values[-1]), None)
+            continue
+
+        # control changes are sent at the end of their nucleotide
+        ticks = firstTick + noteLength * (nucleotides[rows] + 1)
+        rowKeep = np.zeros(len(rows), dtype = bool)
+        changes = np.flatnonzero(values[1:] != values[:-1]) + 1
+        # jump from one control change sent to the next: the first row out of the interval
+        # that differs from the value last sent
+        row = 0 if lastTick is None else int(np.searchsorted(ticks, lastTick + minInterval))
+        while row < len(rows):
+            if values[row] == lastValue:
+                nextChange = int(np.searchsorted(changes, row, side = 'right'))
+                if nextChange == len(changes):
+                    break
+                row = int(changes[nextChange])
+                continue
+            rowKeep[row] = True
+            lastValue, lastTick = int(values[row]), int(ticks[row])
+            row = int(np.searchsorted(ticks, lastTick + minInterval))
+        if isLast and values[-1] != lastValue:
+            # the structure ends before the interval does, its last value is sent anyway
+            rowKeep[-1] = True
+            lastValue, lastTick = int(values[-1]), int(ticks[-1])
+        keep[rows] = rowKeep
+        lastValues[controller] = (lastValue, lastTick)
+
+    mainCounts = mainCounts - np.bincount(nucleotides[~keep], minlength = len(mainCounts))
+    return (mainEvents[keep], mainCounts)
+
+voiceNames = ['Melody', 'Pseudoknots', 'Pulse', 'Pan', 'Distance']
+
+# split the emitted events of a chunk into voices, events get absolute times starting at firstTick
+# melody and pseudoknots only keep their notes (pseudoknots move to channel 1), the pulse is
+# a note on channel 2 for every nucleotide and the CCs get a lane each
+def splitVoices(mainEvents, mainCounts, pkEvents, pkCounts, firstTick, noteLength):
+    nucleotideTicks = firstTick + noteLength * np.arange(len(mainCounts))
+
+    # every nucleotide advances the main track by noteLength
+    mainEvents = mainEvents.copy()
+    mainEvents[:, 0] = firstTick + np.cumsum(mainEvents[:, 0])
+    # pauses are the note offs starting a nucleotide
+    starts = np.cumsum(mainCounts) - mainCounts
+    isPause = np.zeros(len(mainEvents), dtype = bool)
+    isPause[starts[mainEvents[starts, 1] == 0x80]] = True
+    isCC = mainEvents[:, 1] == 0xb0
+    melody = mainEvents[~isCC & ~isPause]
+    pan = mainEvents[isCC & (mainEvents[:, 2] == 21)]
+    distance = mainEvents[isCC & (mainEvents[:, 2] == 20)]
+
+    # pseudoknot note on at the start of its nucleotide, note off (closing pseudoknots) at its end
+    pkNucleotides = np.repeat(np.arange(len(pkCounts)), pkCounts)
+    pkRows = np.arange(len(pkEvents)) - (np.cumsum(pkCounts) - pkCounts)[pkNucleotides]
+    isPK = (pkEvents[:, 1] == 0x90) | (pkRows == 1)
+    pseudoknots = pkEvents[isPK].copy()
+    pseudoknots[:, 0] = nucleotideTicks[pkNucleotides[isPK]] + noteLength * pkRows[isPK]
+    pseudoknots[:, 1] |= 1
+
+    pulse = np.zeros((2 * len(mainCounts), 4), dtype = np.int64)
+    pulse[0::2] = np.column_stack((nucleotideTicks, np.full(len(mainCounts), 0x92),
+                                   np.full(len(mainCounts), 60), np.full(len(mainCounts), 64)))
+    pulse[1::2] = pulse[0::2] + [noteLength, -0x10, 0, 0]
+
+    return [melody, pseudoknots, pulse, pan, distance]
+
+# turn events with absolute times into events with delta times
+def toDeltaTimes(events):
+    events = events.copy()
+    events[:, 0] = np.diff(events[:, 0], prepend = 0)
+    return events
+
+# split a string into chunks
+def iterChunks(wuss, chunkSize):
+    return (wuss[start:start + chunkSize] for start in range(0, len(wuss), chunkSize))
+
+# append events to a midi track, in bulk if the track takes events (midiWriter tracks)
+def appendEvents(midiTrack, events):
+    if hasattr(midiTrack, 'appendEvents'):
+        midiTrack.appendEvents(events)
+    else:
+        midiTrack.extend(eventsToMessages(events))
+
+# compile a CSSD string into run-length segments of nucleotides played the same way
+# prevChar and nextChar are the nucleotides around it when the string is a chunk of a longer structure
+# returns the lengths, play modes (index in playModes) and chords (index in chordTypes) of the segments
+def compileStructure(wuss, prevChar = '', nextChar = ''):
+    nucl = np.frombuffer(wuss.encode('ascii', 'replace'), dtype = np.uint8)
+    prevNucl = np.empty_like(nucl)
+    prevNucl[:1] = ord(prevChar) if prevChar else 0
+    prevNucl[1:] = nucl[:-1]
+    nextNucl = np.empty_like(nucl)
+    nextNucl[:-1] = nucl[1:]
+    nextNucl[-1:] = ord(nextChar) if nextChar else 0
+
+    # select strategy depending on how the nucleotide is structured
+    modes = modeLookup[nucl]
+    if (modes < 0).any():
+        raise KeyError(wuss[int(np.argmax(modes < 0))])
+
+    # exception for first after loop
+    isPK = (nucl == ord('[')) | (nucl == ord(']'))
+    modes[(prevNucl == ord('_')) & (nucl != ord('_')) & ~isPK] = playModes.index('Stable')
+    modes[(nucl == ord(']')) & (prevNucl != ord(']'))] = playModes.index('Pseudoknot Stable')
+    modes[(nucl == ord(']')) & (prevNucl == ord(']'))] = playModes.index('Pseudoknot Down')
+
+    # add increments in start end positions of interior loops
+    chords = np.zeros(len(nucl), dtype = np.int64)
+    chords[(nucl == ord('-')) & (nextNucl != ord('-'))] = chordTypes.index('Interior Loop')
+    # add octaves in start end positions of helix
+    chords[(nucl == ord('(')) & (nextNucl != ord('('))] = chordTypes.index('Helix')
+    chords[(nucl == ord(')')) & (prevNucl != ord(')'))] = chordTypes.index('Helix')
+
+    # merge runs of nucleotides with the same play mode and chord
+    segmentStarts = np.flatnonzero(np.diff(modes, prepend = -1) | np.diff(chords, prepend = -1))
+    lengths = np.diff(np.append(segmentStarts, len(nucl)))
+
+    return (lengths, modes[segmentStarts], chords[segmentStarts])
 
 # find distance between min and max notes played
 def findMaxNoteDistance(wuss):
@@ -176,7 +344,7 @@ def findMaxNoteDistance(wuss):
 
     return maxDist
 
-# determine first note played by putting the whole sequence in 
+# determine first note played by putting the whole sequence in
 # the middle of the piano keyboard
 def findFirstNote(maxDist, notes):
     firstNote = 0
@@ -194,203 +362,605 @@ def findFirstNote(maxDist, notes):
 
         octaLow = int(firstPosition / len(notes))
         firstNote = notes[int(firstPosition % len(notes))]
-        
+
     return firstNote, octaveLow
 
+# precomputed midi notes of a scale over an octave range
+# the pitch state is the index of a note of the scale counted from the lowest octave,
+# so going up or down the scale is state + 1 or state - 1, cycling back to the other end of the range
+class PitchTable:
+
+    def __init__(self, notes, octaveL, octaveH):
+        self.size = len(notes) * (octaveH - octaveL + 1)
+
+        # intervals added in start end positions of interior loops and helices
+        self.interiorLoopIntervals = [2, -2, 4]
+        self.helixIntervals = [2*len(notes), 3*len(notes), 4*len(notes)]
+
+        # midi note, printed name and chords of each pitch state
+        self.midiNotes = []
+        self.noteStrings = []
+        self.interiorLoopChords = []
+        self.helixChords = []
+        for state in range(self.size):
+            note = notes[state % len(notes)]
+            octave = octaveL + int(state / len(notes))
+            # scale play in range (octave, octave + 1) so that root note is always 1st
+            if note < notes[0]:
+                octave += 1
+            noteToInput = min(note + octave*12, 127)
+            self.midiNotes.append(noteToInput)
+            self.noteStrings.append(noteNames[noteToInput - octave*12] + str(octave))
+            self.interiorLoopChords.append([findIncriment(notes, note, octave, interval)
+                                            for interval in self.interiorLoopIntervals])
+            self.helixChords.append([findIncriment(notes, note, octave, interval)
+                                     for interval in self.helixIntervals])
+
+        # disharmony notes (midi note and printed name) that can be played from each octave
+        # in case of chromatic scale there is no disharmony, any note of the scale is played
+        notInScaleNotes = [x for x in range(12) if x not in notes]
+        if not notInScaleNotes:
+            notInScaleNotes = notes
+        self.disharmonyNotes = []
+        for prevOct in range(octaveL, octaveH + 1):
+            choices = []
+            for note in notInScaleNotes:
+                octave = min(prevOct + 2, 8)
+                if note < notes[0]:
+                    octave += 1
+                noteToInput = min(note + octave*12, 127)
+                choices.append((noteToInput, noteNames[noteToInput - octave*12] + str(octave)))
+            self.disharmonyNotes.append(choices)
+
+        # arrays to look up many pitch states at once
+        self.midiNotes = np.array(self.midiNotes)
+        self.noteStrings = np.array(self.noteStrings, dtype = object)
+        self.interiorLoopChords = np.array(self.interiorLoopChords).reshape(-1, 3)
+        self.helixChords = np.array(self.helixChords).reshape(-1, 3)
+        self.disharmonyStrings = np.array([[string for _, string in choices] for choices in self.disharmonyNotes],
+                                          dtype = object)
+        self.disharmonyNotes = np.array([[note for note, _ in choices] for choices in self.disharmonyNotes])
+
+# pitch tables are shared by all sonifiers using the same scale, key and octave range
+@functools.lru_cache(maxsize = None)
+def findPitchTable(notes, octaveL, octaveH):
+    return PitchTable(list(notes), octaveL, octaveH)
+
+# notes of the pseudoknot voice
+# each opening '[' takes the lowest free slot, slot s plays a 5th (7 semitones) s + 1 times above the
+# first note, and its closing ']' plays (and turns off) the note of its own '[', found in the pair table.
+# Slots are freed when their pair closes, so any number of pseudoknots stays in the same range
+# (whole octaves above the first note, up to note 127) instead of climbing a 5th per pseudoknot.
+# Without a pair table (structures streamed in chunks) ']' close the last '[' still open
+class PseudoknotVoice:
+
+    def __init__(self, firstNote, pairTable = None):
+        self.firstNote = min(firstNote, 127 - 12)
+        self.span = 12 * ((127 - self.firstNote) // 12)
+        self.pairTable = pairTable
+
+        self.freeSlots = []
+        self.slotsUsed = 0
+        # slot of every '[' still open, by position
+        self.openSlots = {}
+        self.openStack = []
+
+    # midi notes of the pseudoknot nucleotides at positions (in the order of the structure),
+    # isOpen tells '[' from ']'
+    def findNotes(self, positions, isOpen):
+        slots = np.empty(len(positions), dtype = np.int64)
+        partners = self.pairTable[positions].tolist() if self.pairTable is not None else None
+        for i, (position, opening) in enumerate(zip(positions.tolist(), isOpen.tolist())):
+            if opening:
+                if self.freeSlots:
+                    slot = heapq.heappop(self.freeSlots)
+                else:
+                    slot = self.slotsUsed
+                    self.slotsUsed += 1
+                self.openSlots[position] = slot
+                if partners is None:
+                    self.openStack.append(position)
+            else:
+                partner = partners[i] if partners is not None else self.openStack.pop()
+                slot = self.openSlots.pop(partner)
+                heapq.heappush(self.freeSlots, slot)
+            slots[i] = slot
+        return self.firstNote + (7 * (slots + 1)) % self.span
+
+# turns CSSD strings into midi tracks
+# the scale and the midi port are set up once and reused for every structure sonified
+class Sonifier:
+
+    def __init__(self, scale = 'Minor', key = 0, noteLength = int(1920/16), octaveL = 2, octaveH = 8,
+                 sendToPort = 0, port = 0, verbose = False, playbackThread = False, seed = None, profiler = None,
+                 ccChangesOnly = False, ccInterval = 0):
+        # choose a scale
+        self.notes = selectNotes(scale, key, verbose)
+
+        self.noteLength = noteLength # 1920 = whole note
+
+        # set highest and lowest octave to be played
+        self.octaveH = octaveH
+        self.octaveL = octaveL
+
+        self.sendToPort = sendToPort
+        self.port = port
+        self.verbose = verbose
+        # play to the midi port from a dedicated thread while the next chunks are rendered
+        self.playbackThread = playbackThread
+        self.scheduler = None
+
+        # random draws (disharmony notes) come from a numpy generator created from seed on each render,
+        # so a structure sonified with the same int or numpy.random.SeedSequence seed always gives the
+        # same midi. A numpy.random.Generator is used as it is, its draws go on from render to render
+        self.seed = seed
+        self.rng = None
+
+        # only send control changes (pan, distance) that change their value,
+        # at most one per controller every ccInterval ticks if it is set
+        self.ccChangesOnly = ccChangesOnly or ccInterval > 0
+        self.ccInterval = ccInterval
+
+        # time spent in each stage and counts of the emitted events, added up over every render
+        self.profiler = profiling.Profiler() if profiler is None else profiler
+
+        self.pitchTable = findPitchTable(tuple(self.notes), octaveL, octaveH)
+
+    # check a CSSD string and index its pairs before any midi work, structures can also be
+    # given as a structureIndex.StructureIndex built earlier, which is used as it is
+    def indexStructure(self, structure):
+        with self.profiler.stage('validate'):
+            return structureIndex.indexStructure(structure)
+
+    # check and index a CSSD string (or StructureIndex) and render it chunk by chunk
+    # distances can be passed in if they are already calculated
+    # yields what render yields for each chunk
+    def iterRender(self, wuss, distances = None, chunkSize = 1 << 16):
+        structure = self.indexStructure(wuss)
+        wuss = structure.wuss
+
+        # calculate distance from beginning of branch for each nucleotide
+        if distances is None:
+            with self.profiler.stage('findDistances'):
+                distances = randomRNA.findDistances(wuss)
+
+        yield from self.render(iterChunks(wuss, chunkSize), len(wuss), distances, wuss[-1:], structure.pairTable)
+
+    # create the main melody and pseudoknots midi tracks of a CSSD string (or StructureIndex)
+    # distances can be passed in if they are already calculated
+    def sonify(self, wuss, distances = None, chunkSize = 1 << 16):
+        # main melody and pseudoknots midi tracks
+        import mido
+        midiTrack = mido.MidiTrack()
+        midiTrackPK = mido.MidiTrack()
+
+        for index, mainEvents, mainCounts, pkEvents, pkCounts in self.iterRender(wuss, distances, chunkSize):
+            appendEvents(midiTrack, mainEvents)
+            appendEvents(midiTrackPK, pkEvents)
+
+        return (midiTrack, midiTrackPK)
+
+    # same as sonify, but return arrays of (delta time, status, data 1, data 2) events instead of
+    # mido tracks, for midiWriter to save them without creating a mido message per event
+    def sonifyEvents(self, wuss, distances = None, chunkSize = 1 << 16):
+        midiTrack = midiWriter.EventTrack()
+        midiTrackPK = midiWriter.EventTrack()
+
+        for index, mainEvents, mainCounts, pkEvents, pkCounts in self.iterRender(wuss, distances, chunkSize):
+            midiTrack.appendEvents(mainEvents)
+            midiTrackPK.appendEvents(pkEvents)
+
+        return (midiTrack.events(), midiTrackPK.events())
+
+    # sonify a CSSD string into one array of events per voice (see voiceNames), to be saved as
+    # a single multi-track midi file. Sparse voices only hold their own notes, their delta times
+    # add up the nucleotides in between instead of filling them with pauses
+    def sonifyVoices(self, wuss, distances = None, chunkSize = 1 << 16):
+        voices = [midiWriter.EventTrack() for _ in voiceNames]
+        for index, notesNum, chunkVoices in self.iterVoices(wuss, distances, chunkSize):
+            for voice, events in zip(voices, chunkVoices):
+                voice.appendEvents(events)
+
+        return [toDeltaTimes(voice.events()) for voice in voices]
+
+    # the voices of a CSSD string (or StructureIndex) chunk by chunk, so they are never held whole
+    # yields the index of the first nucleotide, the number of nucleotides and the voices
+    # (see splitVoices, absolute times) of each chunk
+    def iterVoices(self, wuss, distances = None, chunkSize = 1 << 16):
+        return self.splitRendered(self.iterRender(wuss, distances, chunkSize))
+
+    # same as iterVoices for a structure file, streamed like sonifyFile does
+    def iterFileVoices(self, filename, chunkSize = 1 << 16):
+        return self.splitRendered(self.iterRenderFile(filename, chunkSize))
+
+    # split the chunks yielded by render into voices, see iterVoices
+    def splitRendered(self, rendered):
+        for index, mainEvents, mainCounts, pkEvents, pkCounts in rendered:
+            yield (index, len(mainCounts), splitVoices(mainEvents, mainCounts, pkEvents, pkCounts,
+                                                       index * self.noteLength, self.noteLength))
+
+    # the seed as a value of the cache key, None if renders can't be reproduced from it
+    def seedKey(self):
+        if isinstance(self.seed, (int, np.integer)):
+            return int(self.seed)
+        if isinstance(self.seed, np.random.SeedSequence):
+            return [self.seed.entropy, list(self.seed.spawn_key)]
+        return None
+
+    # the contents of the midi files of a CSSD string: melody and pseudoknots files, or a single
+    # multi-track file. With a midiCache.MidiCache, a structure rendered before with the same
+    # parameters and seed is read back instead of rendered. Live playback and renders that can't
+    # be reproduced (no seed, or a generator) are never cached
+    def renderMidiFiles(self, wuss, singleFile = False, cache = None):
+        structure = self.indexStructure(wuss)
+        wuss = structure.wuss
+
+        if cache is None or self.sendToPort or self.seedKey() is None:
+            return self.encodeMidiFiles(structure, singleFile)
+
+        params = {'notes': list(self.notes), 'noteLength': self.noteLength,
+                  'octaveL': self.octaveL, 'octaveH': self.octaveH, 'seed': self.seedKey(),
+                  'ccChangesOnly': self.ccChangesOnly, 'ccInterval': self.ccInterval}
+        layouts = ('voices',) if singleFile else ('melody', 'pseudoknots')
+        import midiCache
+        keys = [midiCache.cacheKey(wuss, structure.pairTable, layout = layout, **params) for layout in layouts]
+        with self.profiler.stage('cache'):
+            files = [cache.get(key) for key in keys]
+        if None in files:
+            files = self.encodeMidiFiles(structure, singleFile)
+            with self.profiler.stage('cache'):
+                for key, data in zip(keys, files):
+                    cache.put(key, data)
+        return files
+
+    # sonify and encode the midi files of a CSSD string, see renderMidiFiles
+    def encodeMidiFiles(self, wuss, singleFile = False):
+        tracks = [self.sonifyVoices(wuss)] if singleFile else [[events] for events in self.sonifyEvents(wuss)]
+        with self.profiler.stage('encode'):
+            return [midiWriter.encodeMidiFile(fileTracks) for fileTracks in tracks]
+
+    # sonify a structure file without keeping the structure or the midi tracks in memory
+    # the midi events are written to disk as they are created (see iterRenderFile)
+    # returns the number of nucleotides
+    def sonifyFile(self, filename, midiFilename, midiFilenamePK, chunkSize = 1 << 16):
+
+        # the structure is checked before any midi is written
+        rendered = self.iterRenderFile(filename, chunkSize)
+        notesNum = 0
+        with midiWriter.StreamingMidiFile(midiFilename) as midiTrack:
+            with midiWriter.StreamingMidiFile(midiFilenamePK) as midiTrackPK:
+                for index, mainEvents, mainCounts, pkEvents, pkCounts in rendered:
+                    with self.profiler.stage('save'):
+                        midiTrack.appendEvents(mainEvents)
+                        midiTrackPK.appendEvents(pkEvents)
+                    notesNum = index + len(mainCounts)
+
+        return notesNum
+
+    # render a structure file chunk by chunk without holding the structure in memory
+    # a cheap pre-pass checks the structure and finds the number of nucleotides and the max distance
+    # right away, then the file is read again in chunks by the render generator that is returned
+    def iterRenderFile(self, filename, chunkSize = 1 << 16):
+
+        notesNum = 0
+        maxDistance = 0
+        with self.profiler.stage('findDistances'):
+            chunks = structureIndex.checkChunks(iterStructureFile(filename, chunkSize))
+            for distance in randomRNA.iterDistances(chunks):
+                notesNum += 1
+                maxDistance = max(maxDistance, distance)
+
+        # remap to 0-127 values (in order to comply with midi messages)
+        distances = (int(round(distance*127/maxDistance, 0)) if maxDistance else 0
+                        for distance in randomRNA.iterDistances(iterStructureFile(filename, chunkSize)))
+
+        return self.render(iterStructureFile(filename, chunkSize), notesNum, distances, lastNucleotide(filename))
+
+    # compile and emit a structure given in chunks, playing the events to the midi port on the way
+    # (sendToPort seconds per nucleotide, scheduled on the tick times of the events)
+    # lastChar is the last nucleotide of the structure, the first one looks back to it (like wuss[-1])
+    # pairTable is the pair table of the structure (see structureIndex.py), to match the pseudoknots
+    # yields the index of the first nucleotide and the emitted events of each chunk
+    # the time spent reading chunks, compiling, emitting, playing and printing is added to the profiler
+    def render(self, chunks, notesNum, distances, lastChar, pairTable = None):
+        distances = iter(distances)
+        profiler = self.profiler
+
+        # initialize shit
+        state = 0 # pitch state of previous note of MIDI sequence (first note of the lowest octave)
+        # pseudoknot notes start a 5th below the 2nd octave of the range
+        pkVoice = PseudoknotVoice(self.notes[0] + (self.octaveL + 2)*12 - 7, pairTable)
+        self.rng = np.random.default_rng(self.seed)
+
+        # maxDist = findMaxNoteDistance(wuss)
+        # prevNote, prevOct = findFirstNote(maxDist, notes)
+        # print('First note:', prevNote)
+
+        if self.sendToPort:
+            import playback
+            self.scheduler = playback.Scheduler(self.port, self.sendToPort / self.noteLength, self.playbackThread)
+
+        ccValues = {}
+
+        index = 0
+        prevChar = lastChar
+        chunks = iter(chunks)
+        with profiler.stage('read'):
+            chunk = next(chunks, '')
+        while chunk:
+            with profiler.stage('read'):
+                nextChunk = next(chunks, '')
+
+            with profiler.stage('compile'):
+                segments = compileStructure(chunk, prevChar, nextChunk[:1])
+            with profiler.stage('findDistances'):
+                chunkDistances = np.fromiter(itertools.islice(distances, len(chunk)), dtype = np.int64,
+                                             count = len(chunk))
+            with profiler.stage('emit'):
+                mainEvents, mainCounts, pkEvents, pkCounts, noteStrings, state = self.emit(
+                    segments, chunkDistances, index, notesNum, state, pkVoice)
+
+            profiler.count('nucleotides', len(chunk))
+            profiler.count('chordNotes', 3 * np.count_nonzero(mainCounts == 10))
+            if self.ccChangesOnly:
+                with profiler.stage('thin'):
+                    mainEvents, mainCounts = thinControlChanges(mainEvents, mainCounts, index * self.noteLength,
+                                                                self.noteLength, ccValues, self.ccInterval,
+                                                                not nextChunk)
+            profiler.count('events', len(mainEvents) + len(pkEvents))
+            profiler.count('controlChanges', np.count_nonzero(mainEvents[:, 1] == 0xb0))
+            profiler.count('pseudoknotNotes', np.count_nonzero(pkEvents[:, 1] == 0x90))
+
+            if self.sendToPort:
+                with profiler.stage('port'):
+                    self.scheduler.schedule(playback.portTimeline(mainEvents, mainCounts, pkEvents, pkCounts,
+                                                                  index * self.noteLength, self.noteLength))
+            if self.verbose:
+                with profiler.stage('print'):
+                    print(' '.join(noteStrings), end = ' ')
+            yield (index, mainEvents, mainCounts, pkEvents, pkCounts)
+
+            index += len(chunk)
+            prevChar = chunk[-1]
+            chunk = nextChunk
+
+        if self.sendToPort:
+            with profiler.stage('port'):
+                self.scheduler.join()
+            # waiting for deadlines and sending, out of the time spent in the port stage
+            # (or in the playback thread)
+            profiler.addTime('port wait', self.scheduler.waitSeconds, 0)
+            profiler.addTime('port send', self.scheduler.sendSeconds, self.scheduler.messagesSent)
+
+    # emit the midi events of compiled segments in bulk
+    # index is the position of the first nucleotide in the structure, state (and the open
+    # pseudoknots of pkVoice) are carried on from the previous chunk
+    # events are rows of (delta time, status, data 1, data 2) and counts are the number of events of each nucleotide
+    def emit(self, segments, distances, index, notesNum, state, pkVoice):
+        pitchTable = self.pitchTable
+        noteLength = self.noteLength
+
+        lengths, modes, chords = segments
+        modes = np.repeat(modes, lengths)
+        chords = np.repeat(chords, lengths)
+        nucleotides = np.arange(index, index + len(modes))
+
+        # going past the end of the scale cycles to the next octave and
+        # past the highest (lowest) octave back to the lowest (highest) one
+        steps = (modes == playModes.index('Up')).astype(np.int64) - (modes == playModes.index('Down'))
+        states = (state + np.cumsum(steps)) % pitchTable.size
+        isScale = modes <= playModes.index('Stable')
+        isDisharmony = modes == playModes.index('Disharmony')
+        willNotePlay = isScale | isDisharmony
+        hasChords = isScale & (chords != chordTypes.index('None'))
+
+        notesToInput = pitchTable.midiNotes[states]
+        noteStrings = pitchTable.noteStrings[states]
+        chordNotes = np.where((chords == chordTypes.index('Interior Loop'))[:, None],
+                              pitchTable.interiorLoopChords[states], pitchTable.helixChords[states])
+
+        # random notes out of the scale, drawn in the order of the nucleotides
+        disharmonies = np.flatnonzero(isDisharmony)
+        if len(disharmonies):
+            choices = pitchTable.disharmonyNotes.shape[1]
+            draws = self.rng.integers(0, choices, len(disharmonies))
+            octaves = states[disharmonies] // len(self.notes)
+            notesToInput[disharmonies] = pitchTable.disharmonyNotes[octaves, draws]
+            noteStrings[disharmonies] = pitchTable.disharmonyStrings[octaves, draws]
+        noteStrings[~willNotePlay] = '-'
+
+        # midi CC 21: pan, looked up in the pan curve of the whole sequence
+        panValues = np.searchsorted(findPanCurve(notesNum), nucleotides, side = 'right')
+
+        # main melody events of each nucleotide:
+        # note on (+ 3 chord notes on), note off after noteLength (+ 3 chord notes off), CC 21, CC 20
+        # or a pause of noteLength, CC 21, CC 20
+        mainCounts = np.where(hasChords, 10, np.where(willNotePlay, 4, 3))
+        ends = np.cumsum(mainCounts)
+        starts = ends - mainCounts
+        mainEvents = np.zeros((len(ends) and ends[-1], 4), dtype = np.int64)
+        mainEvents[:, 3] = 64
+
+        single = starts[willNotePlay & ~hasChords]
+        mainEvents[single, 1] = 0x90
+        mainEvents[single, 2] = notesToInput[willNotePlay & ~hasChords]
+        mainEvents[single + 1] = np.column_stack((np.full(len(single), noteLength), np.full(len(single), 0x80),
+                                                  notesToInput[willNotePlay & ~hasChords], np.full(len(single), 64)))
+
+        chord = starts[hasChords]
+        mainEvents[chord, 1] = 0x90
+        mainEvents[chord, 2] = notesToInput[hasChords]
+        mainEvents[chord + 4, 0] = noteLength
+        mainEvents[chord + 4, 1] = 0x80
+        mainEvents[chord + 4, 2] = notesToInput[hasChords]
+        for interval in range(3):
+            mainEvents[chord + 1 + interval, 1] = 0x90
+            mainEvents[chord + 1 + interval, 2] = chordNotes[hasChords, interval]
+            mainEvents[chord + 5 + interval, 1] = 0x80
+            mainEvents[chord + 5 + interval, 2] = chordNotes[hasChords, interval]
+
+        pause = starts[~willNotePlay]
+        mainEvents[pause, 0] = noteLength
+        mainEvents[pause, 1] = 0x80
+
+        mainEvents[ends - 2, 1] = 0xb0
+        mainEvents[ends - 2, 2] = 21
+        mainEvents[ends - 2, 3] = panValues
+        # midi CC 20: distances
+        mainEvents[ends - 1, 1] = 0xb0
+        mainEvents[ends - 1, 2] = 20
+        mainEvents[ends - 1, 3] = distances
+
+        # pseudoknot events: a pause of noteLength for every other nucleotide, the pseudoknot note
+        # after noteLength (see PseudoknotVoice, a ']' plays the note of its '['),
+        # closing pseudoknots add the note off of their pair after noteLength
+        isPK = modes >= playModes.index('Pseudoknot Up')
+        isPKClose = modes >= playModes.index('Pseudoknot Stable')
+        pkNotes = pkVoice.findNotes(nucleotides[isPK], ~isPKClose[isPK])
+        pkCounts = np.where(isPKClose, 2, 1)
+        pkStarts = np.cumsum(pkCounts) - pkCounts
+        pkEvents = np.zeros((int(pkCounts.sum()), 4), dtype = np.int64)
+        pkEvents[:, 0] = noteLength
+        pkEvents[:, 1] = 0x80
+        pkEvents[:, 3] = 64
+        pkEvents[pkStarts[isPK], 1] = 0x90
+        pkEvents[pkStarts[isPK], 2] = pkNotes
+        pkEvents[pkStarts[isPKClose] + 1, 2] = pkNotes[isPKClose[isPK]]
+
+        if len(mainEvents) and (mainEvents[:, 2:].max() > 127 or mainEvents[:, 2:].min() < 0):
+            raise ValueError('data byte must be in range 0..127')
+        if len(pkEvents) and (pkEvents[:, 2].max() > 127 or pkEvents[:, 2].min() < 0):
+            raise ValueError('data byte must be in range 0..127')
+
+        if len(modes):
+            state = int(states[-1])
+        return (mainEvents, mainCounts, pkEvents, pkCounts, noteStrings.tolist(), state)
+
 if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser(description = 'Sonify an RNA secondary structure in CSSD format')
+    parser.add_argument('structure', nargs = '?', default = 'random',
+                        help = "name of a .txt file in 'RNA structures' (default: a random structure)")
+    parser.add_argument('--length', type = int, default = None,
+                        help = 'number of nucleotides of the random structure (default: 100-200 at random)')
+    parser.add_argument('--loops', type = int, default = None,
+                        help = 'number of hairpin loops of the random structure (default: 1-3 at random)')
+    parser.add_argument('--pseudoknots', type = int, default = None,
+                        help = 'number of pseudoknots of the random structure (default: one half of the time)')
+    parser.add_argument('--offline', action = 'store_true',
+                        help = 'only render the MIDI files, never open a MIDI port or sleep')
+    parser.add_argument('--port', action = 'append', default = None, dest = 'ports',
+                        help = "MIDI port to send to, as 'name' or 'name=channels' (e.g. 'Synth A=0,3'), "
+                             "repeat it to send channels to several ports (default: every channel to 'loopMIDI Port 1')")
+    parser.add_argument('--playback-thread', action = 'store_true',
+                        help = 'play to the MIDI port from a dedicated thread while the structure is rendered')
+    parser.add_argument('--stream', action = 'store_true',
+                        help = 'read the structure in chunks and write the MIDI files while they are created')
+    parser.add_argument('--single-file', action = 'store_true',
+                        help = 'save a single MIDI file with one track per voice (melody, pseudoknots, pulse, CC lanes)')
+    parser.add_argument('--cc-changes-only', action = 'store_true',
+                        help = 'only send pan and distance control changes when their value changes')
+    parser.add_argument('--cc-interval', type = int, default = 0,
+                        help = 'least number of ticks between two control changes of a controller (implies --cc-changes-only)')
+    parser.add_argument('--quiet', action = 'store_true', help = 'print nothing but errors, not even the notes played')
+    parser.add_argument('--profile', default = None,
+                        help = 'JSON file the time spent in each stage and counts of emitted events are saved to')
+    parser.add_argument('--cprofile', default = None, help = 'file cProfile statistics of the whole run are saved to')
+    parser.add_argument('--seed', type = int, default = None,
+                        help = 'seed of every random choice (structure, key, disharmony notes), to reproduce a run')
+    parser.add_argument('--cache', default = None,
+                        help = 'directory of a cache of rendered MIDI files, used when rendering --offline')
+    parser.add_argument('--cache-size', type = float, default = 256,
+                        help = 'size cap of the cache in MB (default: 256)')
+    args = parser.parse_args()
+    if args.stream and args.single_file:
+        parser.error('--single-file can not be used with --stream')
+    if args.stream and args.cache:
+        parser.error('--cache can not be used with --stream')
+
     # make RNA structures directory
     if not os.path.exists('RNA structures/'):
         os.makedirs('RNA structures/')
 
+    profiler = profiling.Profiler(cprofile = args.cprofile is not None)
+    profiler.start()
+
+    # independent random streams for the choices made here and for the sonifier
+    # (an unseeded sonifier draws fresh entropy and is never cached, its render can't be reproduced)
+    choicesSeed, sonifierSeed = np.random.SeedSequence(args.seed).spawn(2)
+    rng = np.random.default_rng(choicesSeed)
+    if args.seed is None:
+        sonifierSeed = None
+
     # if no arguments were passed or want to sonify something at random
-    if len(sys.argv) == 1 or sys.argv[1] == 'random':
+    if args.structure == 'random':
         filename = 'RNA structures/random.txt'
-        # create a random RNA structure with 100-200 nucleotides and 1-3 hairpin loops
-        wuss, numberOfLoops = randomRNA.createRandomRNAstructure(random.randint(100, 200), random.randint(1,3))
-        f = open('RNA structures/random.txt','w+')
-        f.write(wuss)
-        f.close()
+        # create a random RNA structure, with 100-200 nucleotides and 1-3 hairpin loops unless given
+        numberOfNucl = int(rng.integers(100, 201)) if args.length is None else args.length
+        numberOfLoops = int(rng.integers(1, 4)) if args.loops is None else args.loops
+        with profiler.stage('generate'):
+            wuss, numberOfLoops = randomRNA.createRandomRNAstructure(numberOfNucl, numberOfLoops, rng,
+                                                                     args.pseudoknots, verbose = not args.quiet)
+            f = open('RNA structures/random.txt','w+')
+            f.write(wuss)
+            f.close()
     else:
-        filename = 'RNA structures/' + sys.argv[1] + '.txt'
-
-    f = open(filename, 'r')
-    wuss = f.read()
-    f.close()
+        filename = 'RNA structures/' + args.structure + '.txt'
 
     # set mido stuff
-    sendToPort, midiTrack, port, theMidiFile = initializeMido()
-
-    # calculate distance from beginning of branch for each nucleotide
-    distances = randomRNA.findDistances(wuss)
-
-    notesNum = len(wuss)
+    try:
+        sendToPort, port = initializeMido(0 if args.offline else 0.01, args.ports)
+    except ValueError as error:
+        parser.error(str(error))
 
-    # strategies calculating the next note to be inputed in midi track
-    strategies = {'(': 'Up', '<': 'Up', ')': 'Down', '>': 'Down', '_': 'Pause', ':': 'Pause',
-                    '-' :'Stable', ',': 'Disharmony', '[': 'Pseudoknot', ']': 'Pseudoknot'}
-    noteNames = {0:'C', 1:'Db', 2:'D', 3:'Eb', 4:'E', 5:'F', 6:'Gb', 7:'G', 8:'Ab', 9:'A', 10:'Bb', 11:'B'}
-
-    # choose a scale
-    notes = selectNotes('Minor', random.randint(0, 11))
-
-    noteLength = int(1920/16) # 1920 = whole note
-
-    # set highest and lowest octave to be played
-    octaveH = 8
-    octaveL = 2
-
-    # initialize shit
-    prevNote = 0 # index of previous note of the scale of MIDI sequence
-    prevOct = octaveL # previous octave of MIDI sequence
-    
-    # maxDist = findMaxNoteDistance(wuss)
-    # prevNote, prevOct = findFirstNote(maxDist, notes)
-    # print('First note:', prevNote)
-
-    # # input first note (the root note of the selected scale always)
-    # inputNote(notes, prevNote, octaveL, noteLength, True, [0, 0, 0], sendToPort)
-
-    # pseudoknots midi track
-    midiTrackPK = mido.MidiTrack()
-    theMidiFilePK = mido.MidiFile()
-    theMidiFilePK.tracks.append(midiTrackPK)
-    # initialize previous to first pseudoknot note to input
-    prevPKnote = notes[0] + (octaveL + 2)*12 - 7
-
-    # iterate through all nucleotides
-    for index in range(notesNum):
-
-        # starting state for all nucleotides: play one note with no intervals added
-        willNotePlay = True
-        intervals = [0, 0, 0]
-
-        # add increments in start end positions of interior loops
-        if wuss[index] == '-' and wuss[index + 1] != '-':
-            intervals = [2, -2, 4]
-
-        # add octaves in start end positions of helix
-        if wuss[index] == '(' and  wuss[index + 1] != '(':
-            intervals = [2*len(notes), 3*len(notes), 4*len(notes)]
-        elif wuss[index] == ')' and wuss[index - 1] != ')':
-            intervals = [2*len(notes), 3*len(notes), 4*len(notes)]
-        
-        # select strategy depending on how the nucleotide is structured
-        playMode = strategies[wuss[index]]
-        # exception for first after loop
-        if wuss[index - 1] == '_' and wuss[index] != '_':
-            # exception for pseudoknots
-            if wuss[index] != '[' and wuss[index] != ']':
-                playMode = 'Stable' 
-
-        # select note to play depending on strategy   
-        if playMode == 'Up':
-            if prevNote == len(notes)-1: # if prev note was last of scale
-                noteToInput = notes[0] # go to first note of scale
-                prevNote = 0
-                if octaveH - octaveL > 0: # if there are more octaves
-                    if octaveH != prevOct: # if the highest octave isn't reached yet
-                        octaveToInput = prevOct + 1 # go up an octave
-                        prevOct += 1
-                    else: # if we already are at the highest octave
-                        octaveToInput = octaveL # cycle back to the lowest octave
-                        prevOct = octaveL
-            else:
-                noteToInput = notes[prevNote + 1]
-                octaveToInput = prevOct
-                prevNote += 1
-
-        elif playMode == 'Down':
-            if prevNote == 0: # if prev note was first of scale
-                noteToInput = notes[-1] # go to last note of scale
-                prevNote = len(notes) - 1
-                if octaveH - octaveL > 0: # if there are more octaves
-                    if octaveL != prevOct: # if the lowest octave isn't reached yet
-                        octaveToInput = prevOct - 1 # go down an octave
-                        prevOct -= 1
-                    else: # if we already are at the lowest octave
-                        octaveToInput = octaveH # cycle back to the highest octave
-                        prevOct = octaveH
-            else:
-                noteToInput = notes[prevNote - 1]
-                octaveToInput = prevOct
-                prevNote -= 1
-            
-        elif playMode == 'Stable':
-            noteToInput = notes[prevNote]
-            octaveToInput = prevOct
-
-        elif playMode == 'Pause':
-            noteToInput = notes[prevNote]
-            octaveToInput = prevOct
-            willNotePlay = False
-
-        elif playMode == 'Disharmony':
-            allNotes = list(range(0,12))
-            notInScaleNotes = [x for x in allNotes if x not in notes]
-            if notInScaleNotes: # in case of chromatic scale there is no disharmony
-                noteToInput = notInScaleNotes[random.randint(0,len(notInScaleNotes)-1)]
-            else:
-                noteToInput = notes[random.randint(0,len(notes) - 1)]
-            octaveToInput = min(prevOct + 2, 8)
-        
-        elif playMode == 'Pseudoknot':
-            willNotePlay = False
-            # send main melody velocity to channel 
-            port.send(mido.Message('note_on', velocity = 127, channel = 4))
-
-            if wuss[index] == '[':
-                # add 5th from previous PK note
-                PKnote = prevPKnote + 7
-            elif wuss[index] == ']':
-                if wuss[index - 1] != ']':
-                    PKnote = prevPKnote
-                else:
-                    # subtract 4th from previous PK note
-                    PKnote = prevPKnote - 7
-            prevPKnote = PKnote
-            midiTrackPK.append(mido.Message('note_on', note = PKnote, time = noteLength))
-            # midiTrackPK.append(mido.Message('note_off', time = noteLength))
-            if wuss[index] == ']':
-                midiTrackPK.append(mido.Message('note_off', note = PKnote, time = noteLength))
-            if sendToPort:
-                port.send(mido.Message('note_on', note = PKnote, channel = 1, velocity = 127))
-      
-        # pause pseudoknot tracks
-        if playMode != 'Pseudoknot':
-            midiTrackPK.append(mido.Message('note_off', time = noteLength))
-
-        # scale play in range (octave, octave + 1) so that root note is always 1st
-        if noteToInput < notes[0]:
-            octaveToInput += 1
-
-        # input note to midi track
-        inputNote(notes, noteToInput, octaveToInput, noteLength, 
-                                willNotePlay, intervals, sendToPort)        
-
-        # send control change depending on position
-        # midi CC 21: pan
-        if index == 0:
-            panValue = 0
-        elif index == notesNum - 1:
-            panValue = 1
-        else:
-            panValue = index / notesNum # map linearly to 0-1
-            panValue = 1 / (1 + math.exp(-10*(panValue - 0.5))) # transform to sigmoid (scale factor 10)
-        panValue = int(round(panValue * 127, 0)) # remap to 0-127
-        sendQuickMessage(mido.Message('control_change', control = 21, value = panValue), port)
-
-        # send control change depending on distance
-        # midi CC 20: distances
-        sendQuickMessage(mido.Message('control_change', control = 20, value = distances[index]), port)
-  
-
-    # close midi ports
-    if sendToPort:
-        port.close()
+    # choose a key at random
+    sonifier = Sonifier('Minor', int(rng.integers(0, 12)), sendToPort = sendToPort, port = port,
+                        verbose = not args.quiet, playbackThread = args.playback_thread, seed = sonifierSeed,
+                        profiler = profiler, ccChangesOnly = args.cc_changes_only, ccInterval = args.cc_interval)
 
     # save midi files to 'MIDI files' folder
     if not os.path.exists('MIDI files/'):
         os.makedirs('MIDI files/')
-    theMidiFile.save('MIDI files/thisIsAnRNAstructure.mid')
-    theMidiFilePK.save('MIDI files/thisIsAnRNAstructurePKs.mid')
\ No newline at end of file
+    midiFilename = 'MIDI files/thisIsAnRNAstructure.mid'
+    midiFilenamePK = 'MIDI files/thisIsAnRNAstructurePKs.mid'
+
+    try:
+        if args.stream:
+            sonifier.sonifyFile(filename, midiFilename, midiFilenamePK)
+        else:
+            # line breaks and spaces are ignored, like when streaming
+            with profiler.stage('read'):
+                f = open(filename, 'r')
+                wuss = ''.join(f.read().split())
+                f.close()
+
+            cache = None
+            if args.cache:
+                import midiCache
+                cache = midiCache.MidiCache(args.cache, int(args.cache_size * (1 << 20)))
+
+            for outputFilename, data in zip((midiFilename, midiFilenamePK),
+                                            sonifier.renderMidiFiles(wuss, args.single_file, cache)):
+                with profiler.stage('save'):
+                    f = open(outputFilename, 'wb')
+                    f.write(data)
+                    f.close()
+
+            if cache is not None and not args.quiet:
+                print('\nMIDI cache: %(hits)d hits, %(misses)d misses, %(evictions)d evictions' % cache.stats())
+    except structureIndex.StructureError as error:
+        print('Invalid structure in %s: %s' % (filename, error), file = sys.stderr)
+        sys.exit(1)
+    finally:
+        # close midi ports, once every queued message is sent
+        if sendToPort:
+            port.close()
+            for name, stats in port.stats().items():
+                if stats['dropped']:
+                    print('%s: %d MIDI messages dropped (%s)' % (name, stats['dropped'], stats['error']), file = sys.stderr)
+
+    profiler.stop()
+    if args.profile:
+        profiler.writeJson(args.profile)
+    if args.cprofile:
+        profiler.dumpStats(args.cprofile)
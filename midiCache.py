@@ -0,0 +1,134 @@
+'''
+On-disk cache of rendered MIDI files
+-Entries are content addressed: the key is a hash of the CSSD string, of the partners of its
+ pseudoknots and of every parameter that changes the rendered MIDI (scale notes, note length,
+ octave range, seed, layout)
+-The cache has a size cap, the least recently used entries are evicted first. Processes can
+ share a directory: once a process goes over the cap (or every rescanInterval stores) it reads the
+ files on disk again, so the entries stored by the others count, and evicts down to lowWater of the
+ cap. The directory can go over the cap by what the others stored since their last scan
+-Hits, misses and evictions are counted so the cap can be tuned
+'''
+
+import os
+import json
+import hashlib
+import collections
+import numpy as np
+
+# bump it whenever the rendered MIDI changes, so older entries are never returned
+cacheVersion = 3
+
+# entries over the cap are evicted down to this fraction of it, so the directory is not read
+# again on every store once the cache is full
+lowWater = 0.9
+# the directory is read again at least every rescanInterval stores
+rescanInterval = 1024
+
+# hash a CSSD string and the parameters it is rendered with into a cache key
+# pairTable is the pair table of the structure (see structureIndex.py): structures converted from
+# other formats can share a CSSD string but pair their pseudoknots differently
+def cacheKey(wuss, pairTable = None, **params):
+    h = hashlib.sha256()
+    h.update(json.dumps(dict(params, version = cacheVersion), sort_keys = True).encode('utf-8'))
+    h.update(b'\n')
+    h.update(wuss.encode('ascii'))
+    if pairTable is not None:
+        isPK = np.frombuffer(wuss.encode('ascii'), dtype = np.uint8) == ord('[')
+        h.update(b'\n')
+        h.update(np.ascontiguousarray(pairTable[isPK], dtype = '<i8').tobytes())
+    return h.hexdigest()
+
+# MIDI files stored as <key>.mid in a directory, up to maxBytes in total
+# the modification time of a file is the last time it was used, so the order survives restarts
+class MidiCache:
+
+    def __init__(self, directory, maxBytes = 256 << 20):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # key -> size, least recently used first
+        self.entries = collections.OrderedDict()
+        self.totalBytes = 0
+        self.scan()
+        self.evict()
+
+    # read the entries of the directory, with the ones stored or used by other processes sharing it
+    def scan(self):
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.mid'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # evicted by another process while scanning
+                    continue
+                found.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        self.entries = collections.OrderedDict((key, size) for _, key, size in sorted(found))
+        self.totalBytes = sum(self.entries.values())
+        self.unscanned = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.mid')
+
+    # the stored bytes of a key, or None on a miss
+    # the file is looked for even if the key is not indexed, another process may have stored it
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = f.read()
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            # never stored, or evicted by another process sharing the directory
+            if key in self.entries:
+                self.totalBytes -= self.entries.pop(key)
+            self.misses += 1
+            return None
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        else:
+            self.entries[key] = len(data)
+            self.totalBytes += len(data)
+        self.hits += 1
+        return data
+
+    # store the bytes of a key, then evict the least recently used entries over the size cap
+    # (the entry just stored is kept even if it is bigger than the cap)
+    def put(self, key, data):
+        # written to a temporary file first, so readers never see a partial entry
+        temporary = self.path(key) + '.%d.tmp' % os.getpid()
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, self.path(key))
+
+        self.totalBytes += len(data) - self.entries.pop(key, 0)
+        self.entries[key] = len(data)
+        self.unscanned += 1
+        if self.totalBytes > self.maxBytes or self.unscanned >= rescanInterval:
+            # other processes may have stored entries since the last scan
+            self.scan()
+            self.entries[key] = self.entries.pop(key, len(data))
+            self.evict()
+
+    # over the size cap, remove the least recently used entries till the cache fits lowWater of it
+    def evict(self):
+        if self.totalBytes <= self.maxBytes:
+            return
+        while self.totalBytes > self.maxBytes * lowWater and len(self.entries) > 1:
+            oldKey, size = self.entries.popitem(last = False)
+            self.totalBytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(oldKey))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self.entries), 'bytes': self.totalBytes}
@@ -0,0 +1,133 @@
+'''
+Write standard MIDI files (SMF) straight to disk
+-StreamingMidiFile writes the events of a track as they are appended,
+ so memory stays the same no matter how long the track is
+-Files are encoded like mido.MidiFile.save() does (type 1, running status)
+-Events given as rows of (delta time, status, data 1, data 2) are encoded in bulk into
+ a preallocated byte buffer, without creating a mido message per event
+'''
+
+import struct
+import numpy as np
+
+# end of track meta message, with no delta time
+endOfTrack = b'\x00\xff\x2f\x00'
+
+# encode rows of (delta time, status, data 1, data 2) channel messages with 2 data bytes
+# runningStatus is the status of the message before the first one (None at the start of a track)
+# returns the encoded bytes and the running status after the last message
+def encodeEvents(events, runningStatus = None):
+    events = np.asarray(events, dtype = np.int64).reshape(-1, 4)
+    if len(events) == 0:
+        return (b'', runningStatus)
+    deltas = events[:, 0]
+    statuses = events[:, 1]
+    if deltas.min() < 0 or deltas.max() >= 1 << 28:
+        raise ValueError('message time must be in range 0..2**28-1 in MIDI file')
+    if statuses.max() > 0xff or not np.isin(statuses & 0xf0, [0x80, 0x90, 0xa0, 0xb0, 0xe0]).all():
+        raise ValueError('only channel messages with 2 data bytes can be encoded')
+
+    # bytes of each delta time (7 bits per byte) and status bytes left out by running status
+    deltaBytes = 1 + (deltas >= 1 << 7) + (deltas >= 1 << 14) + (deltas >= 1 << 21)
+    previousStatuses = np.empty_like(statuses)
+    previousStatuses[0] = -1 if runningStatus is None else runningStatus
+    previousStatuses[1:] = statuses[:-1]
+    hasStatus = statuses != previousStatuses
+
+    sizes = deltaBytes + hasStatus + 2
+    offsets = np.cumsum(sizes) - sizes
+    encoded = np.zeros(int(sizes.sum()), dtype = np.uint8)
+
+    # delta times, most significant 7 bits first, every byte but the last one has its top bit set
+    for byte in range(4):
+        rows = np.flatnonzero(deltaBytes > byte)
+        shift = 7 * (deltaBytes[rows] - 1 - byte)
+        encoded[offsets[rows] + byte] = ((deltas[rows] >> shift) & 0x7f) | np.where(shift > 0, 0x80, 0)
+
+    position = offsets + deltaBytes
+    encoded[position[hasStatus]] = statuses[hasStatus]
+    position += hasStatus
+    encoded[position] = events[:, 2]
+    encoded[position + 1] = events[:, 3]
+
+    return (encoded.tobytes(), int(statuses[-1]))
+
+# encode the track chunk of an event track (end of track message included)
+def encodeTrack(events):
+    data = encodeEvents(events)[0] + endOfTrack
+    return b'MTrk' + struct.pack('>L', len(data)) + data
+
+# encode a type 1 midi file with one track per array of events
+def encodeMidiFile(tracks, ticksPerBeat = 480):
+    data = bytearray(b'MThd' + struct.pack('>Lhhh', 6, 1, len(tracks), ticksPerBeat))
+    for events in tracks:
+        data.extend(encodeTrack(events))
+    return bytes(data)
+
+# write a type 1 midi file with one track per array of events, in one go
+def writeMidiFile(filename, tracks, ticksPerBeat = 480):
+    data = encodeMidiFile(tracks, ticksPerBeat)
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+# collects arrays of events, to be used as a track that skips mido messages
+class EventTrack:
+
+    def __init__(self):
+        self.chunks = []
+
+    def appendEvents(self, events):
+        self.chunks.append(np.asarray(events, dtype = np.int64).reshape(-1, 4))
+
+    # all the events of the track as a single array
+    def events(self):
+        if not self.chunks:
+            return np.zeros((0, 4), dtype = np.int64)
+        if len(self.chunks) > 1:
+            self.chunks = [np.concatenate(self.chunks)]
+        return self.chunks[0]
+
+# midi file with a single track whose events are written to disk as they come
+# events are added in bulk with appendEvents()
+class StreamingMidiFile:
+
+    def __init__(self, filename, ticksPerBeat = 480, bufferSize = 1 << 16):
+        self.file = open(filename, 'wb')
+        self.file.write(b'MThd' + struct.pack('>Lhhh', 6, 1, 1, ticksPerBeat))
+        self.file.write(b'MTrk')
+        # track length is unknown till the end, it is filled in on close()
+        self.lengthOffset = self.file.tell()
+        self.file.write(struct.pack('>L', 0))
+
+        self.buffer = bytearray()
+        self.bufferSize = bufferSize
+        self.trackLength = 0
+        self.runningStatus = None
+
+    # encode and add rows of (delta time, status, data 1, data 2) events in bulk
+    def appendEvents(self, events):
+        encoded, self.runningStatus = encodeEvents(events, self.runningStatus)
+        self.buffer.extend(encoded)
+        if len(self.buffer) >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.trackLength += len(self.buffer)
+        self.buffer = bytearray()
+
+    # add the end of track message and fill in the track length
+    def close(self):
+        if self.file.closed:
+            return
+        self.buffer.extend(endOfTrack)
+        self.flush()
+        self.file.seek(self.lengthOffset)
+        self.file.write(struct.pack('>L', self.trackLength))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
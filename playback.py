@@ -0,0 +1,149 @@
+'''
+Real time playback of sonified structures to a MIDI port
+-The messages sent to the port are laid out on a timeline of midi ticks
+-The scheduler sends them against a monotonic clock, waiting for the deadline of each tick,
+ so the time spent sending messages never adds up and the tempo doesn't drift
+-Playback can block, run from a dedicated thread or from an asyncio loop
+'''
+
+import time
+import mido
+import queue
+import asyncio
+import threading
+import numpy as np
+
+# lay out the messages sent to the midi port for the emitted events of a chunk
+# returns rows of (tick, status, data 1, data 2), firstTick is the tick of the first nucleotide
+# each nucleotide sends (pseudoknot velocity and note,) pulse, melody velocity and notes on at its tick,
+# then its notes off and control changes noteLength ticks later
+def portTimeline(mainEvents, mainCounts, pkEvents, pkCounts, firstTick, noteLength):
+    timeline = []
+    mainEvents = mainEvents.tolist()
+    pkEvents = pkEvents.tolist()
+
+    mainStart = 0
+    pkStart = 0
+    tick = firstTick
+    for mainCount, pkCount in zip(mainCounts.tolist(), pkCounts.tolist()):
+        messages = mainEvents[mainStart:mainStart + mainCount]
+        pkNote = pkEvents[pkStart]
+        if pkNote[1] == 0x90:
+            # send pseudoknots melody velocity (channel 4) and pitch (channel 1)
+            timeline.append((tick, 0x94, 0, 127))
+            timeline.append((tick, 0x91, pkNote[2], 127))
+
+        # send pulse
+        timeline.append((tick, 0x92, 60, 64))
+
+        # send main melody velocity to channel 3, then notes on and notes off
+        if messages[0][1] == 0x90:
+            timeline.append((tick, 0x93, 0, 127))
+            for delta, status, data1, data2 in messages:
+                if status != 0xb0:
+                    timeline.append((tick + delta if status == 0x90 else tick + noteLength, status, data1, data2))
+        else:
+            timeline.append((tick, 0x83, 0, 0))
+
+        # send control changes (none if they were thinned out)
+        for delta, status, data1, data2 in messages:
+            if status == 0xb0:
+                timeline.append((tick + noteLength, status, data1, data2))
+
+        mainStart += mainCount
+        pkStart += pkCount
+        tick += noteLength
+
+    return np.array(timeline, dtype = np.int64).reshape(-1, 4)
+
+# sends timelines to a midi port, tick t is due secondsPerTick * t seconds after the start
+# the start is the time the first timeline is scheduled
+class Scheduler:
+
+    def __init__(self, port, secondsPerTick, threaded = False, spin = 0.0005, clock = time.perf_counter):
+        self.port = port
+        self.secondsPerTick = secondsPerTick
+        # the last moments before a deadline are spent polling the clock instead of sleeping
+        self.spin = spin
+        self.clock = clock
+        self.start = None
+
+        # lateness of the messages sent and time spent waiting for deadlines and sending, in seconds
+        self.messagesSent = 0
+        self.maxLateness = 0.0
+        self.totalLateness = 0.0
+        self.waitSeconds = 0.0
+        self.sendSeconds = 0.0
+
+        self.queue = None
+        self.thread = None
+        self.error = None
+        if threaded:
+            # a few timelines can be rendered ahead of the one playing
+            self.queue = queue.Queue(maxsize = 4)
+            self.thread = threading.Thread(target = self.run, daemon = True)
+            self.thread.start()
+
+    # play a timeline, or hand it to the playback thread
+    def schedule(self, timeline):
+        if self.start is None:
+            self.start = self.clock()
+        if self.thread is None:
+            self.play(timeline)
+        else:
+            if self.error is not None:
+                raise self.error
+            self.queue.put(timeline)
+
+    # wait till the playback thread has sent everything scheduled
+    def join(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            if self.error is not None:
+                raise self.error
+
+    def run(self):
+        while True:
+            timeline = self.queue.get()
+            if timeline is None:
+                break
+            try:
+                self.play(timeline)
+            except Exception as error:
+                self.error = error
+
+    # send the messages of a timeline, waiting for the deadline of each tick
+    def play(self, timeline):
+        for tick, status, data1, data2 in timeline.tolist():
+            deadline = self.start + tick * self.secondsPerTick
+            wait = deadline - self.clock()
+            if wait > self.spin:
+                time.sleep(wait - self.spin)
+            while self.clock() < deadline:
+                pass
+            self.waitSeconds += max(wait, 0.0)
+            self.send(mido.Message.from_bytes([status, data1, data2]), deadline)
+
+    # same as play, waiting on an asyncio loop instead of blocking
+    async def playAsync(self, timeline):
+        if self.start is None:
+            self.start = self.clock()
+        for tick, status, data1, data2 in timeline.tolist():
+            deadline = self.start + tick * self.secondsPerTick
+            wait = deadline - self.clock()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                self.waitSeconds += wait
+            self.send(mido.Message.from_bytes([status, data1, data2]), deadline)
+
+    def send(self, message, deadline):
+        start = self.clock()
+        self.port.send(message)
+        sent = self.clock()
+        self.sendSeconds += sent - start
+        lateness = max(0.0, sent - deadline)
+        self.messagesSent += 1
+        self.maxLateness = max(self.maxLateness, lateness)
+        self.totalLateness += lateness
@@ -0,0 +1,180 @@
+'''
+MIDI output ports for live playback: a pool of opened outputs and channel routing
+-Outputs are opened once by name and kept in a pool, every run (or Sonifier) of the process that
+ asks for the same port gets the output already opened
+-A FanOutPort sends each channel to the ports configured for it, e.g. the melody (0, 3) to one
+ synth host and the pseudoknots (1, 4) and pulse (2) to another one
+-Messages are handed to a sender thread per port, which sends whatever piled up in one batch, so
+ a slow (or stalled) receiver never holds up the note generation nor the other ports
+-A port that fails is opened again on its next batch, messages it can't take are counted as dropped
+'''
+
+import queue
+import threading
+import mido
+
+# default port to look into
+defaultPort = 'loopMIDI Port 1'
+# every channel of a port (see createMIDI.py for what they carry)
+allChannels = tuple(range(16))
+
+# outputs opened by this process, by name
+openPorts = {}
+portsLock = threading.Lock()
+
+# open an output port, or get the one already opened with that name
+def openPort(name):
+    with portsLock:
+        if name not in openPorts:
+            openPorts[name] = mido.open_output(name)
+        return openPorts[name]
+
+# close an output port of the pool, it is opened again the next time it is asked for
+def closePort(name):
+    with portsLock:
+        output = openPorts.pop(name, None)
+    if output is not None:
+        output.close()
+
+def closePorts():
+    for name in list(openPorts):
+        closePort(name)
+
+# parse port routes given as 'name' (every channel) or 'name=0,3' (channels 0 and 3)
+# returns a dict of port name -> tuple of channels
+def parseRoutes(specs):
+    routes = {}
+    for spec in specs:
+        name, _, channels = spec.rpartition('=') if '=' in spec else (spec, '', '')
+        name = name.strip()
+        if not name:
+            raise ValueError('no port name in %r' % spec)
+        if channels.strip():
+            try:
+                channels = tuple(int(channel) for channel in channels.split(','))
+            except ValueError:
+                raise ValueError('channels of %r must be numbers separated by commas' % spec)
+            if any(channel not in allChannels for channel in channels):
+                raise ValueError('channels of %r must be in 0..15' % spec)
+        else:
+            channels = allChannels
+        routes[name] = tuple(sorted(set(routes.get(name, ()) + channels)))
+    return routes
+
+# the ports of routes that can't be opened, replaced by ports picked among the available ones
+def pickMissingPorts(routes):
+    picked = {}
+    for name, channels in routes.items():
+        # if that port is not available
+        while name not in mido.get_output_names():
+            print('%s is not available, select one of the following ports to send MIDI data:' % name)
+            print(mido.get_output_names())
+            name = input()
+        picked[name] = tuple(sorted(set(picked.get(name, ()) + channels)))
+    return picked
+
+# sends the messages of one output port from its own thread
+class PortSender:
+
+    def __init__(self, name, maxBacklog = 1 << 16, batchSize = 256):
+        self.name = name
+        self.batchSize = batchSize
+        self.queue = queue.Queue(maxsize = maxBacklog)
+
+        self.messagesSent = 0
+        self.batchesSent = 0
+        self.dropped = 0
+        self.reopened = 0
+        self.error = None
+
+        self.output = openPort(name)
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    # queue a message, it is dropped (and counted) rather than waited for if the backlog is full
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    # send everything queued, then stop the thread
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            while len(batch) < self.batchSize:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                batch.pop()
+                running = False
+            if batch:
+                self.sendBatch(batch)
+
+    def sendBatch(self, batch):
+        if self.output is None:
+            # the port failed on an earlier batch
+            try:
+                self.output = openPort(self.name)
+                self.reopened += 1
+            except Exception as error:
+                self.error = error
+                self.dropped += len(batch)
+                return
+        self.batchesSent += 1
+        for sent, message in enumerate(batch):
+            try:
+                self.output.send(message)
+            except Exception as error:
+                self.error = error
+                self.dropped += len(batch) - sent
+                self.output = None
+                closePort(self.name)
+                return
+            self.messagesSent += 1
+
+    def stats(self):
+        return {'messagesSent': self.messagesSent, 'batchesSent': self.batchesSent, 'dropped': self.dropped,
+                'backlog': self.queue.qsize(), 'reopened': self.reopened,
+                'error': None if self.error is None else str(self.error)}
+
+# a port that routes each message to the ports of its channel, through their sender threads
+# routes is a dict of port name -> channels, messages without a channel go to every port
+# it has the send and close methods of a mido output, so it is used in its place
+class FanOutPort:
+
+    def __init__(self, routes, maxBacklog = 1 << 16, batchSize = 256):
+        self.senders = {}
+        try:
+            for name in routes:
+                self.senders[name] = PortSender(name, maxBacklog, batchSize)
+        except Exception:
+            self.close()
+            raise
+        self.channelSenders = [[self.senders[name] for name, channels in routes.items() if channel in channels]
+                               for channel in allChannels]
+        self.closed = False
+
+    def send(self, message):
+        channel = getattr(message, 'channel', None)
+        for sender in (self.senders.values() if channel is None else self.channelSenders[channel]):
+            sender.put(message)
+
+    # wait till every queued message is sent, closing the outputs unless they are kept in the pool
+    def close(self, closePorts = True):
+        for sender in self.senders.values():
+            sender.stop()
+        if closePorts:
+            for name in self.senders:
+                closePort(name)
+        self.closed = True
+
+    def stats(self):
+        return {name: sender.stats() for name, sender in self.senders.items()}
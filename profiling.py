@@ -0,0 +1,61 @@
+'''
+Instrumentation of the sonification stages
+-Profiler adds up the time spent in each named stage and the number of times it ran
+-Counters keep track of what was emitted (events, chord notes, control changes, pseudoknot notes)
+-An optional cProfile run covers everything between start() and stop()
+-Reports are plain dictionaries, saved as JSON instead of being printed
+'''
+
+import time
+import contextlib
+
+class Profiler:
+
+    def __init__(self, cprofile = False):
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+        self.cprofile = None
+        if cprofile:
+            # imported here, most runs never profile
+            import cProfile
+            self.cprofile = cProfile.Profile()
+
+    # time a block of code as part of a stage: with profiler.stage('emit'): ...
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addTime(name, time.perf_counter() - start)
+
+    def addTime(self, name, seconds, calls = 1):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def count(self, name, value = 1):
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    # cProfile hooks, they do nothing unless the profiler was created with cprofile = True
+    def start(self):
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def stop(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+
+    # save the cProfile statistics, to be read with pstats or snakeviz
+    def dumpStats(self, filename):
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(filename)
+
+    def report(self):
+        return {'stages': {name: {'seconds': self.seconds[name], 'calls': self.calls[name]} for name in self.seconds},
+                'counters': dict(self.counters)}
+
+    def writeJson(self, filename):
+        import json
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent = 1)
@@ -7,238 +7,339 @@ Structure is in dot-bracket, consensus secondary structure descriptor (CSSD) for
 ',': unpaired nucleotides in multi-branch loops
 '_': hairpin loop
 '-': interior loop (or bulge)
-'''
 
-import random
+createRandomRNAstructures creates many structures at once for synthetic corpora,
+into a preallocated array, reproducibly from a seed
+'''
 
-# fills in fully unpaired (',') structure with a hairpin loop, base pairs and interior loops
-# in case of assymetry, leaves an unpaired nucleotide
-def makeBranch(structure):
+import numpy as np
+
+# ascii codes of the structure characters, for structures built as byte arrays
+asciiCodes = {char: ord(char) for char in '()<>[]_-,:'}
+
+# fills the bytes of a fully unpaired (',') branch with a hairpin loop, base pairs and interior loops
+# in case of assymetry, leaves unpaired nucleotides. Returns the start and length of the hairpin loop
+# runs of base pairs go on with a probability of ~0.71 (5/7), runs of interior loops with 0.5,
+# the outermost pair and the pair closing the hairpin loop are always base pairs
+def fillBranch(branch, rng):
+
+    numberOfNucl = len(branch)
+
+    # initialize hairpin loop location and length, constrained to stay approximately in the middle
+    loopLength = int(numberOfNucl/4)
+    loopLength = min(max(int(rng.integers(loopLength - 3, loopLength + 4)), 3), numberOfNucl)
+    loopPosition = round(numberOfNucl/2 - loopLength/2)
+    loopPosition = min(max(int(rng.integers(loopPosition - 1, loopPosition + 2)), 0), numberOfNucl - loopLength)
+    branch[loopPosition:loopPosition + loopLength] = asciiCodes['_']
+
+    # nucleotides paired to the right of the hairpin loop, in case of assymetry the rest stays unpaired
+    pairsNum = min(loopPosition, numberOfNucl - loopPosition - loopLength)
+    if pairsNum == 0:
+        return (loopPosition, loopLength)
+
+    # alternate runs of base pairs and interior loops, each run at least one nucleotide long
+    runs = np.empty(2 * pairsNum, dtype = np.int64)
+    runs[0::2] = rng.geometric(2/7, pairsNum)
+    runs[1::2] = rng.geometric(1/2, pairsNum)
+    isPaired = np.repeat(np.tile(np.array([True, False]), pairsNum), runs)[:pairsNum]
+    isPaired[-1] = True
+
+    left = branch[loopPosition - pairsNum:loopPosition]
+    right = branch[loopPosition + loopLength:loopPosition + loopLength + pairsNum]
+    left[:] = np.where(isPaired, asciiCodes['<'], asciiCodes['-'])
+    right[:] = np.where(isPaired[::-1], asciiCodes['>'], asciiCodes['-'])
+
+    return (loopPosition, loopLength)
+
+# shortest branch that holds a hairpin loop closed by a base pair, and the room kept for each
+# hairpin loop when a multi-branched structure is nested in another one
+minBranchLength = 5
+minNestedLength = 8
+
+# fills structure[startPoint:endPoint] with branches holding numberOfLoops hairpin loops in total
+# groups of several hairpin loops become multi-branched structures closed by their own helices,
+# nested in the one they belong to. Every nucleotide is filled once, so time is linear in length
+# returns the (start, length) of every hairpin loop, in the order they appear
+def fillMultiloop(structure, startPoint, endPoint, numberOfLoops, rng):
+    loops = []
+    regions = [(startPoint, endPoint, min(numberOfLoops, max((endPoint - startPoint) // minNestedLength, 1)))]
+    while regions:
+        regionStart, regionEnd, regionLoops = regions.pop()
+        regionLength = regionEnd - regionStart
+        if regionLoops == 1 or regionLength < 2 * minBranchLength:
+            if regionLength > 0:
+                loopPosition, loopLength = fillBranch(structure[regionStart:regionEnd], rng)
+                loops.append((regionStart + loopPosition, loopLength))
+            continue
+
+        # split the hairpin loops in 2 or more groups, each one gets a part of the region
+        # in proportion to its number of hairpin loops
+        groupsNum = int(rng.integers(2, regionLoops + 1))
+        cuts = np.sort(rng.choice(regionLoops - 1, groupsNum - 1, replace = False)) + 1
+        groupLoops = np.diff(np.concatenate(([0], cuts, [regionLoops])))
+        breakPoints = regionStart + np.cumsum(groupLoops) * regionLength // regionLoops
+        breakPoints = np.concatenate(([regionStart], breakPoints)).tolist()
+
+        for groupStart, groupEnd, loopsNum in zip(breakPoints[:-1], breakPoints[1:], groupLoops.tolist()):
+            groupLength = groupEnd - groupStart
+            if loopsNum == 1:
+                regions.append((groupStart, groupEnd, 1))
+                continue
+
+            # close the nested multi-branched structure with a helix, with an unpaired nucleotide before it
+            numberOfHlxNucl = int(groupLength/10)
+            numberOfHlxNucl = max(int(rng.integers(numberOfHlxNucl - 2, numberOfHlxNucl + 3)), 1)
+            numberOfHlxNucl = min(numberOfHlxNucl, (groupLength - minBranchLength * loopsNum - 1) // 2)
+            if numberOfHlxNucl < 1:
+                regions.append((groupStart, groupEnd, loopsNum))
+                continue
+            structure[groupStart:groupStart + numberOfHlxNucl] = asciiCodes['(']
+            structure[groupEnd - numberOfHlxNucl:groupEnd] = asciiCodes[')']
+            regions.append((groupStart + numberOfHlxNucl, groupEnd - numberOfHlxNucl - 1, loopsNum))
+
+    loops.sort()
+    return (loops)
+
+# fills a uint8 array with a random structure of numberOfLoops hairpin loops, in a single pass
+# with no retries: extra unpaired nucleotides are inserted at positions drawn from the index of
+# eligible sites (interior loops and terminal stems) and the pseudoknots are placed from the
+# positions of the hairpin loops recorded while making the branches
+# pseudoknot is True or False to always or never add one, None to add one half of the time,
+# or a number of pseudoknots to add (one between every two hairpin loops at most)
+# returns the structure and its number of hairpin loops (fewer than asked if they don't fit)
+def fillRandomRNAstructure(structure, numberOfLoops, rng, pseudoknot = None):
 
-	numberOfNucl = len(structure)
+    numberOfNucl = len(structure)
 
-	# initialize hairpin loop location and length
-	loopLength = int(numberOfNucl/4)
-	loopLength = max(random.randint(loopLength - 3, loopLength + 3), 3)
+    # set probability of adding extra unpaired nucleotides to ~0.14 (1/7)
+    numberOfUnpairedNucl = 0
+    if rng.integers(0, 7) == 6 and numberOfNucl > 1:
+        numberOfUnpairedNucl = int(numberOfNucl/22)
+        numberOfUnpairedNucl = min(max(int(rng.integers(numberOfUnpairedNucl - 2, numberOfUnpairedNucl + 3)), 1),
+                                   numberOfNucl - 1)
+
+    # set probability of adding a pseudoknot to 0.5, with 2 to 4 nucleotides on each side
+    pkLengths = []
+    if numberOfLoops > 1 and (rng.integers(0, 2) if pseudoknot is None else pseudoknot):
+        numberOfPKs = 1 if pseudoknot is None else min(int(pseudoknot), numberOfLoops // 2)
+        pkLengths = rng.integers(2, 5, numberOfPKs).tolist()
+
+    # initialize structure with unpaired nucleotides, the extra ones are inserted at the end
+    baseLength = numberOfNucl - numberOfUnpairedNucl
+    base = np.full(baseLength, asciiCodes[','], dtype = np.uint8)
+
+    # add unstructured nucleotides and closing helices
+    numberOfUnstruct = min(int(rng.integers(1, 11)), baseLength // 2)
+    numberOfHlxNucl = int(baseLength/10)
+    numberOfHlxNucl = min(max(int(rng.integers(numberOfHlxNucl - 2, numberOfHlxNucl + 3)), 1), baseLength // 2)
+    outerLength = max(numberOfHlxNucl, numberOfUnstruct)
+    base[:numberOfUnstruct] = asciiCodes[':']
+    base[baseLength - numberOfUnstruct:] = asciiCodes[':']
+    base[numberOfUnstruct:outerLength] = asciiCodes['(']
+    base[baseLength - outerLength:baseLength - numberOfUnstruct] = asciiCodes[')']
+
+    # fill the rest with branches, leaving an unpaired nucleotide before the closing helix
+    startPoint = outerLength
+    endPoint = max(baseLength - outerLength - 1, startPoint)
+    loops = fillMultiloop(base, startPoint, endPoint, numberOfLoops, rng)
+
+    # add the pseudoknots, each one between the next two hairpin loops of the loop index
+    for pkIndex, pkLength in enumerate(pkLengths[:len(loops) // 2]):
+        pkLoops = loops[2 * pkIndex:2 * pkIndex + 2]
+        pkLength = min(pkLength, pkLoops[0][1], pkLoops[1][1])
+        for (loopStart, loopLength), char in zip(pkLoops, '[]'):
+            pkStart = loopStart + int(rng.integers(0, loopLength - pkLength + 1))
+            base[pkStart:pkStart + pkLength] = asciiCodes[char]
+
+    # add unpaired nucleotides before random eligible sites
+    if numberOfUnpairedNucl:
+        eligible = np.flatnonzero((base == asciiCodes['-']) | (base == asciiCodes['<']) | (base == asciiCodes['>']))
+        if len(eligible) == 0:
+            eligible = np.array([endPoint])
+        positions = eligible[rng.integers(0, len(eligible), numberOfUnpairedNucl)]
+        base = np.insert(base, positions, asciiCodes[','])
+
+    structure[:] = base
+    return (structure, len(loops))
 
-	# constrain it to stay approximately in the middle
-	loopPosition =  round(numberOfNucl/2 - loopLength/2, 0)
-	loopPosition = random.randint(loopPosition - 1, loopPosition + 1)
+# creates a random RNA structure with determined number of nucleotides and hairpin loops
+# any number of hairpin loops is split in branches and nested multi-branched structures
+# rng is a seed or a numpy.random.Generator, verbose prints the structure
+def createRandomRNAstructure(numberOfNucl, numberOfLoops, rng = None, pseudoknot = None, verbose = True):
+    rng = np.random.default_rng(rng)
+    structure = np.empty(numberOfNucl, dtype = np.uint8)
+    structure, numberOfLoops = fillRandomRNAstructure(structure, numberOfLoops, rng, pseudoknot)
 
-	# make hairpin loop
-	for index in range(loopPosition, loopPosition + loopLength):
-		structure[index] = '_'
+    # convert it to string and print messages
+    strStructure = structure.tobytes().decode('ascii')
+    if verbose:
+        print('RNA structure:', strStructure)
+        print('Number of hairpin loops: ', numberOfLoops)
+        print('Number of nucleotides: ', len(structure))
 
-	# make base pairs and interior loops
-	for index in range(loopPosition):
+    return (strStructure, numberOfLoops)
 
-		# pairMirrorIndex is the mirrored to the hairpin loop nucleotide of index
-		pairMirrorIndex = loopPosition  + loopLength + (loopPosition - index - 1)
-		if pairMirrorIndex < numberOfNucl:
+# creates count random structures of numberOfNucl nucleotides and numberOfLoops hairpin loops,
+# returned as the rows of a (count, numberOfNucl) uint8 array of ascii codes (out can be a preallocated one)
+# rng is a seed or a numpy.random.Generator, the same seed always gives the same structures
+def createRandomRNAstructures(count, numberOfNucl, numberOfLoops, rng = None, out = None, pseudoknot = None):
+    if numberOfNucl < 1 or numberOfLoops < 1:
+        raise ValueError('structures need at least one nucleotide and one hairpin loop')
+    if out is None:
+        out = np.empty((count, numberOfNucl), dtype = np.uint8)
+    elif out.shape != (count, numberOfNucl) or out.dtype != np.uint8:
+        raise ValueError('out must be a (%d, %d) uint8 array' % (count, numberOfNucl))
 
-			# assign base pair right before hairpin loop and exit loop
-			if structure[index + 1] == '_' or index == 0:
-				structure[index] = '<'
-				structure[pairMirrorIndex] = '>'
+    rng = np.random.default_rng(rng)
+    for structure in out:
+        fillRandomRNAstructure(structure, numberOfLoops, rng, pseudoknot)
 
-			# probability of a base pair vs an interior loop is typically 0.5
-			basePairProb = round(random.random(), 0)
-			# if previous nucleotide was paired, it's more probable to have a base pair again
-			# so base pairing probability changes form 0.5 to ~0.86 (6/7)
-			if structure[index - 1] == '<':
-				basePairProb = round(random.randint(4,10)/10, 0)
+    return (out)
 
-			# if the mirrored nucleotide is no value assigned yet
-			if structure[pairMirrorIndex] == ',':
-				if basePairProb:
-					structure[index] = '<'
-					structure[pairMirrorIndex] = '>'
-				else:
-					structure[index] = '-'
-					structure[pairMirrorIndex] = '-'
+# convert the rows of createRandomRNAstructures output to CSSD strings
+def structureStrings(structures):
+    return ([structure.tobytes().decode('ascii') for structure in np.atleast_2d(structures)])
 
-	return(structure)
+# calculate distance from first paired nucleotides of a branch for each nucleotide
+# (before the remap to 0-127), in one vectorized pass over the bytes of the structure
+#
+# the structure is split in parts, each one ending at the first hairpin loop or pseudoknot
+# nucleotide not followed by a hairpin loop. The center of a part is its first '<' or ')'.
+# Nucleotides get their distance to the center of their part, loops and pseudoknots keep the
+# previous distance. Once the center of a part is a ')', all the remaining nucleotides get
+# their distance to it. The last nucleotide gets the previous distance + 1.
+# Loops at the start take a distance of 0, parts with no center left keep the previous center
+# and structures with no '<' or ')' at all have no distances.
+def findRawDistances(structure):
 
-# randomly add some extra unpaired nucleotides
-def addUnpairedNucl(structure, numberOfUnpairedNucl):
-    numberOfNucl = len(structure)
-    for _ in range(numberOfUnpairedNucl):
-        position = random.randint(0, numberOfNucl - 1)
-        # make sure unpaired nucleotide is not inserted in closing helix or hairpin loops
-        while structure[position] != '-' and structure[position] != '<' and structure[position] != '>':
-            position = random.randint(0, numberOfNucl - 1)
-        structure.insert(position, ',')
-    print('Added extra unpaired nucleotides')
-
-    return (structure)
-
-def addPseudoknot(structure, numberOfPKs):
-    if numberOfPKs == 0:
-        return (structure)
-        
     numberOfNucl = len(structure)
-    # find 1st loop indices
-    loopIndices = []
-    for index in range(len(structure) - 1):
-        if structure[index] == '_':
-            loopIndices.append(index)
-        if structure[index] == '_' and structure[index + 1] != '_':
-            lastIndex = index
-            break
-
-    # add opening pseudoknot
-    validLoopIndices = loopIndices[0:(len(loopIndices) - int(numberOfPKs/2))]
-    startOfPk = validLoopIndices[random.randint(0, len(validLoopIndices) - 1)]
-    for index in range(startOfPk, int(startOfPk + numberOfPKs/2)):
-        structure[index] = '['
-    
-    # find 2nd loop indices
-    loop2Indices = []
-    metFirstLoop = False
-    for index in range(lastIndex + 1, len(structure)):
-        if structure[index - 1] == '_' and structure[index] != '_':
-            metFirstLoop = True
-        if metFirstLoop == True:
-            if structure[index] == '_':
-                loop2Indices.append(index)
-                if structure[index + 1] != '_':
-                    break
-    
-    # add closing pseudoknot
-    print (validLoopIndices)
-    validLoopIndices = loop2Indices[0:(len(loop2Indices) - int(numberOfPKs/2))]
-    startOfPk = validLoopIndices[random.randint(0, len(validLoopIndices) - 1)]
-    for index in range(startOfPk, int(startOfPk + numberOfPKs/2)):
-        structure[index] = ']'
-     
-    print('Added pseudoknot')
-    return (structure)
-
-# creates a random RNA structure with determined number of nucleotides and hairpin loops
-def createRandomRNAstructure(numberOfNucl, numberOfLoops):
-    # set probability of adding extra unpaired nucleotides to ~0.14 (1/7)
-    willAddUnpairedNucl = round(random.randint(0,6)/10, 0)
-    if willAddUnpairedNucl:
-        # define number of unpaired nucleotides and randomize it a bit
-        numberOfUnpairedNucl = int(numberOfNucl/22)
-        numberOfUnpairedNucl = min(random.randint(numberOfUnpairedNucl - 2, numberOfUnpairedNucl + 2), 1)
-        numberOfNucl -= numberOfUnpairedNucl
-
-    #  will a pseudoknot be added?
-    numberOfPKs = 0
-    if numberOfLoops > 1:
-        # set probability of adding a pseudoknot to 0.5 (5/10)  
-        willAddPKs = round(random.randint(1,10)/10, 0)
-        if willAddPKs:
-            # set number of pseudoknot nucleotides between 2 and 4 at random
-            numberOfPKs = random.randint(2, 4) * 2
-
-    # initialize structure with unpaired nucleotides
-    structure = [','] * numberOfNucl
-
-    # add unstructured nucleotides
-    numberOfUnstruct = random.randint(1,10)
-    for index in range(numberOfUnstruct):
-        structure[index] = ':'
-        structure[numberOfNucl - index - 1] = ':'
-    
-    # set number of total nucleotides and number of nucleotides in closing helices
-    numberOfHlxNucl = int(numberOfNucl/10)
-    numberOfHlxNucl = max(random.randint(numberOfHlxNucl - 2, numberOfHlxNucl + 2), 1)
-    # make opening and closing helices
-    for index in range(numberOfHlxNucl - numberOfUnstruct):
-        structure[index + numberOfUnstruct] = '('
-        structure[numberOfNucl - index - 1 - numberOfUnstruct] = ')'
-
-    # crop closing helices
-    startPoint = numberOfHlxNucl
-    endPoint = numberOfNucl - numberOfHlxNucl -1
-
-    # add hairpin loops to structure
-    if numberOfLoops == 1:
-        # fill structure of croped subsequence
-        loop = makeBranch(structure[startPoint:endPoint])
-        # recombine all subsequences
-        structure = structure[0:startPoint] + loop + structure[endPoint:len(structure)]
-
-    elif numberOfLoops == 2:
-        # create 2 subsequences indices (crop closing helices)
-        seqBreakPoint = int(len(structure)/2)
-        # fill each subsequence individually
-        loop1 = makeBranch(structure[startPoint:seqBreakPoint])
-        loop2 = makeBranch(structure[(seqBreakPoint):endPoint])
-        # recombine all subsequences
-        structure = structure[0:startPoint] + loop1 + loop2 + structure[endPoint:len(structure)]
-    else:
-        # create 2 subsequences indices (crop closing helices)
-        seqBreakPoint1 = int(len(structure)/3)
-        seqBreakPoint2 = int(len(structure)/3*2)
-        # fill each subsequence individually
-        loop1 = makeBranch(structure[startPoint:seqBreakPoint1])
-        loop2 = makeBranch(structure[(seqBreakPoint1):seqBreakPoint2])
-        loop3 = makeBranch(structure[(seqBreakPoint2):endPoint])
-        # recombine all subsequences
-        structure = structure[0:startPoint] + loop1 + loop2 + loop3 + structure[endPoint:len(structure)]
-
-    # add unpaired nucleotides to the sequence
-    if willAddUnpairedNucl:
-        structure = addUnpairedNucl(structure, numberOfUnpairedNucl)
-    
-    # add pseudoknots to the sequence
-    if numberOfLoops > 1:
-        structure = addPseudoknot(structure, numberOfPKs)
+    if numberOfNucl == 0:
+        return np.zeros(0, dtype = np.int64)
+
+    nucl = np.frombuffer(structure.encode('ascii'), dtype = np.uint8)
+    # the last nucleotide is never a center nor a loop, it is filled in at the end
+    body = nucl[:-1]
+    nextNucl = nucl[1:]
+    indices = np.arange(numberOfNucl - 1)
+
+    isLoop = (body == ord('_')) | (body == ord('[')) | (body == ord(']'))
+    isCenter = (body == ord('<')) | (body == ord(')'))
+    isPartEnd = isLoop & (nextNucl != ord('_'))
+
+    # first index of the part each nucleotide belongs to
+    partEnds = np.maximum.accumulate(np.where(isPartEnd, indices, -1))
+    partStarts = np.empty_like(indices)
+    partStarts[:1] = 0
+    partStarts[1:] = partEnds[:-1] + 1
+
+    # center of each part: the first '<' or ')' from its start, numberOfNucl if there is none
+    nextCenter = np.where(isCenter, indices, numberOfNucl)
+    nextCenter = np.minimum.accumulate(nextCenter[::-1])[::-1]
+    centers = nextCenter[partStarts]
+    hasCenter = centers < numberOfNucl
+
+    # from the first part centered on ')' every nucleotide uses that center
+    isEnd = np.zeros(len(indices), dtype = bool)
+    isEnd[hasCenter] = nucl[centers[hasCenter]] == ord(')')
+    isEnd = np.logical_or.accumulate(isEnd)
+    if isEnd.any():
+        centers = np.where(isEnd, centers[np.argmax(isEnd)], centers)
+
+    # parts with no center left keep the center of the last part that had one
+    if hasCenter.any() and not hasCenter.all():
+        centers = np.where(hasCenter, centers, centers[np.flatnonzero(hasCenter)[-1]])
+        hasCenter[:] = True
+
+    distances = np.where(hasCenter, np.abs(indices - centers), 0)
+
+    # keep previous distance if hairpin or internal loop or pseudoknot
+    isFilled = isEnd | ~isLoop
+    lastFilled = np.maximum.accumulate(np.where(isFilled, indices, -1))
+    distances = np.where(lastFilled >= 0, distances[np.maximum(lastFilled, 0)], 0)
+
+    # fill in last one
+    lastDistance = distances[-1] + 1 if len(distances) else 1
+    return np.append(distances, lastDistance)
+
+# remap the distances of every nucleotide to 0-127 values (in order to comply with midi messages)
+def findDistances(structure):
 
-    # convert it to string and print messages
-    strStructure = ''.join(structure)
-    print('RNA structure:', strStructure)
-    print('Number of hairpin loops: ', numberOfLoops)
-    print('Number of nucleotides: ', len(structure))
+    distances = findRawDistances(structure)
+    if len(distances) == 0:
+        return []
 
-    return (strStructure, numberOfLoops)
+    maxVal = distances.max()
+    distances = np.rint(distances * 127 / maxVal).astype(np.int64)
 
-# calculate distance from first paired nucleotides of a branch for each nucleotide
-def findDistances(structure):
+    return (distances.tolist())
 
-    # initialize dinstances list
-    distances = [0] * len(structure)
+# calculate the same distances as findDistances one nucleotide at a time, before the remap to 0-127
+# structure can be a string or any iterable of string chunks, so long structures can be streamed
+# nucleotides waiting for the center of their branch are kept as runs of [first index, length, isLoop]
+def iterDistances(structure):
 
+    center = None # first paired nucleotide of the current part
+    staleCenter = None # center of the previous part, kept if no center is left in the structure
     foundEnd = False
-    nextPartStartIndex = 0
-    
-    while not foundEnd:
-
-        # find next center
-        for index in range(nextPartStartIndex, len(structure) - 1):
-            if structure[index] == '<' or structure[index] == ')':
-                center = index
-                if structure[index] == ')':
-                    foundEnd = True
-                break
-
-        # fill till first paired nucleotides of next branch or end helix is found
-        for index in range(nextPartStartIndex, len(structure) - 1):
-            if not foundEnd:
-                # keep previous distance if hairpin or internal loop or pseudoknot
-                if structure[index] == '_' or structure[index] == '[' or structure[index] == ']':
-                    distances[index] = prevDistance
-                    # break if found loop
-                    if structure[index + 1] != '_':
-                        nextPartStartIndex = index + 1
-                        break
-                # fill in distance otherwise
-                else:
-                    distances[index] = abs(index - center)
-                    prevDistance = distances[index]
+    pending = []
+    prevDistance = 0
+
+    index = -1
+    char = None
+    for chunk in structure:
+        for nextChar in chunk:
+            if char is None:
+                index += 1
+                char = nextChar
+                continue
+
+            # keep previous distance if hairpin or internal loop or pseudoknot
+            isLoop = char == '_' or char == '[' or char == ']'
+
             # fill distance for closing helix nucleotides
+            if foundEnd:
+                prevDistance = abs(index - center)
+                yield prevDistance
             else:
-                distances[index] = abs(index - center)
-                prevDistance = distances[index]
+                # found the center of the current part
+                if center is None and (char == '<' or char == ')'):
+                    center = index
+                    foundEnd = char == ')'
+                    for start, length, runIsLoop in pending:
+                        for pendingIndex in range(start, start + length):
+                            if not runIsLoop or foundEnd:
+                                prevDistance = abs(pendingIndex - center)
+                            yield prevDistance
+                    pending = []
+
+                if center is None:
+                    if pending and pending[-1][2] == isLoop:
+                        pending[-1][1] += 1
+                    else:
+                        pending.append([index, 1, isLoop])
+                elif isLoop and not foundEnd:
+                    yield prevDistance
+                else:
+                    prevDistance = abs(index - center)
+                    yield prevDistance
+
+                # a loop not followed by a hairpin loop ends the part, the next one needs a new center
+                if isLoop and nextChar != '_' and not foundEnd and center is not None:
+                    staleCenter = center
+                    center = None
+
+            index += 1
+            char = nextChar
 
-    # # fill in last one
-    distances[len(structure)-1] = prevDistance + 1
+    if char is None:
+        return
 
-    # remap to 0-127 values (in order to comply with midi messages)
-    maxVal = max(distances)
-    distances = [int(round(i*127/maxVal, 0)) for i in distances]
+    # no center left, use the one of the previous part (a structure with no pairs has no distances)
+    for start, length, runIsLoop in pending:
+        for pendingIndex in range(start, start + length):
+            if not runIsLoop:
+                prevDistance = 0 if staleCenter is None else abs(pendingIndex - staleCenter)
+            yield prevDistance
 
-    return (distances)
+    # fill in last one
+    yield prevDistance + 1
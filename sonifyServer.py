@@ -0,0 +1,322 @@
+'''
+Long-lived sonification server: MIDI files over HTTP, on localhost or on a Unix socket
+-POST /render with a CSSD string as the body, or GET /render?name=<name> for a .txt file of
+ 'RNA structures', returns the MIDI file (audio/midi)
+-Query parameters: scale, key (0-11, default: drawn from the seed), seed, and layout: 'voices' (one
+ multi-track file, default), 'melody' or 'pseudoknots' (the two files createMIDI.py saves)
+-The same name and seed give the same MIDI as 'createMIDI.py <name> --offline --seed <seed>'
+-Structures are rendered by a pool of worker processes started (and warmed up) once, so a request
+ only waits for its render. At most workers + queue size requests are in flight, the others get a
+ 503 with a Retry-After header right away instead of piling up
+-GET /stats returns the number of requests by status and the p50 / p99 latency of the last requests
+ (time waiting for a worker, render time and total), as JSON
+'''
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+import signal
+import argparse
+import threading
+import collections
+import socketserver
+import http.server
+import urllib.parse
+import concurrent.futures
+import numpy as np
+import createMIDI
+import structureIndex
+
+# the files a layout returns, index in the files of Sonifier.renderMidiFiles and whether they are a single file
+layouts = {'voices': (0, True), 'melody': (0, False), 'pseudoknots': (1, False)}
+
+# names of structure files a request may ask for, no paths
+structureName = re.compile(r'^[\w.-]+$')
+
+# cache opened by each worker process (see startWorker)
+workerCache = None
+
+# set up a worker process, with its own handle on the cache
+def startWorker(cacheDir, cacheSize):
+    global workerCache
+    if cacheDir:
+        import midiCache
+        workerCache = midiCache.MidiCache(cacheDir, cacheSize)
+    # the first render fills the pitch tables, so no request pays for them
+    createMIDI.Sonifier('Minor', 0, seed = 0).renderMidiFiles('<<__>>', True)
+
+# render a structure in a worker process, returns the MIDI file and the render time in seconds
+def renderRequest(wuss, scale, key, seed, layout):
+    start = time.perf_counter()
+    index, singleFile = layouts[layout]
+    sonifier = createMIDI.Sonifier(scale, key, seed = seed)
+    data = sonifier.renderMidiFiles(wuss, singleFile, workerCache)[index]
+    return (data, time.perf_counter() - start)
+
+# latencies of the last requests, in seconds, and the number of requests by status
+class LatencyMetrics:
+
+    def __init__(self, window = 10000):
+        self.lock = threading.Lock()
+        self.latencies = {name: collections.deque(maxlen = window) for name in ('queue', 'render', 'total')}
+        self.statuses = collections.Counter()
+
+    def add(self, status, **seconds):
+        with self.lock:
+            self.statuses[status] += 1
+            for name, value in seconds.items():
+                self.latencies[name].append(value)
+
+    def report(self):
+        with self.lock:
+            report = {'requests': sum(self.statuses.values()),
+                      'statuses': {str(status): count for status, count in sorted(self.statuses.items())}}
+            for name, values in self.latencies.items():
+                values = np.array(values)
+                report[name] = {'count': len(values)}
+                if len(values):
+                    p50, p99 = np.percentile(values, [50, 99])
+                    report[name].update(p50 = p50, p99 = p99, max = float(values.max()))
+        return report
+
+# the worker pool and its bounded queue, shared by the request threads
+class RenderPool:
+
+    def __init__(self, workers = None, queueSize = 16, cacheDir = None, cacheSize = 256 << 20, timeout = 60.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers = self.workers, initializer = startWorker,
+                                                               initargs = (cacheDir, cacheSize))
+        # a slot for every request rendering or waiting for a worker, freed when its render ends
+        # (not when its client gives up), so the pool is never handed more than it can hold
+        self.slots = threading.BoundedSemaphore(self.workers + queueSize)
+        self.capacity = self.workers + queueSize
+        self.inFlight = 0
+        self.lock = threading.Lock()
+        self.timeout = timeout
+        self.metrics = LatencyMetrics()
+
+        # start every worker now rather than on the first requests
+        concurrent.futures.wait([self.executor.submit(time.sleep, 0.1) for _ in range(self.workers)])
+
+    # submit a render, returns its future, or None when the queue is full
+    def submit(self, *arguments):
+        if not self.slots.acquire(blocking = False):
+            return None
+        with self.lock:
+            self.inFlight += 1
+        future = self.executor.submit(renderRequest, *arguments)
+        future.add_done_callback(self.release)
+        return future
+
+    # a render ended (whether its client still waits or not)
+    def release(self, future):
+        with self.lock:
+            self.inFlight -= 1
+        self.slots.release()
+
+    def stats(self):
+        with self.lock:
+            inFlight = self.inFlight
+        return dict(self.metrics.report(), workers = self.workers, capacity = self.capacity, inFlight = inFlight)
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures = True)
+
+# a request that can't be rendered, with the HTTP status it is answered with
+class RequestError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# answers /render and /stats, one thread per connection
+class SonifyHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.dispatch(None)
+
+    def do_POST(self):
+        length = self.headers.get('Content-Length')
+        if length is None:
+            return self.sendText(411, 'Content-Length required')
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # the body can't be told apart from the next request
+            self.close_connection = True
+            return self.sendText(400, 'invalid Content-Length')
+        if length > self.server.maxBodyBytes:
+            self.close_connection = True
+            return self.sendText(413, 'structure longer than %d bytes' % self.server.maxBodyBytes)
+        self.dispatch(self.rfile.read(length))
+
+    # answer a request, body is None for GET requests
+    def dispatch(self, body):
+        start = time.perf_counter()
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/stats' and body is None:
+            return self.sendJson(200, self.server.pool.stats())
+        if url.path != '/render':
+            return self.sendText(404, 'unknown path %s' % url.path)
+
+        pool = self.server.pool
+        try:
+            arguments = self.parseRequest(urllib.parse.parse_qs(url.query), body)
+            future = pool.submit(*arguments)
+            if future is None:
+                pool.metrics.add(503)
+                return self.sendText(503, 'render queue full', {'Retry-After': '1'})
+            data, renderSeconds = future.result(timeout = pool.timeout)
+        except RequestError as error:
+            pool.metrics.add(error.status)
+            return self.sendText(error.status, str(error))
+        except structureIndex.StructureError as error:
+            pool.metrics.add(400)
+            return self.sendText(400, 'invalid structure: %s' % error)
+        except concurrent.futures.TimeoutError:
+            pool.metrics.add(504)
+            return self.sendText(504, 'render took longer than %g s' % pool.timeout)
+        except Exception as error:
+            pool.metrics.add(500)
+            return self.sendText(500, '%s: %s' % (type(error).__name__, error))
+
+        seconds = time.perf_counter() - start
+        pool.metrics.add(200, queue = max(seconds - renderSeconds, 0.0), render = renderSeconds, total = seconds)
+        self.send(200, 'audio/midi', data, {'X-Render-Seconds': '%.6f' % renderSeconds})
+
+    # the arguments of renderRequest from the query parameters and the body of a request
+    def parseRequest(self, query, body):
+        def parameter(name, default = None):
+            return query[name][-1] if name in query else default
+
+        if 'name' in query:
+            name = parameter('name')
+            filename = os.path.join(self.server.structuresDir, name + '.txt')
+            if not structureName.match(name) or not os.path.isfile(filename):
+                raise RequestError(404, 'no structure named %r' % name)
+            with open(filename, 'r') as f:
+                wuss = f.read()
+        elif body is not None:
+            wuss = body.decode('ascii', 'replace')
+        elif 'structure' in query:
+            wuss = parameter('structure')
+        else:
+            raise RequestError(400, 'a structure (request body or structure parameter) or a name is needed')
+        # line breaks and spaces are ignored, like in structure files
+        wuss = ''.join(wuss.split())
+        if not wuss:
+            raise RequestError(400, 'empty structure')
+
+        layout = parameter('layout', 'voices')
+        if layout not in layouts:
+            raise RequestError(400, 'layout must be one of %s' % ', '.join(layouts))
+        scale = parameter('scale', 'Minor')
+        try:
+            createMIDI.selectNotes(scale, 0, verbose = False)
+        except KeyError:
+            raise RequestError(400, 'unknown scale %r' % scale)
+        try:
+            seed = None if parameter('seed') is None else int(parameter('seed'))
+            key = None if parameter('key') is None else int(parameter('key')) % 12
+        except ValueError as error:
+            raise RequestError(400, str(error))
+
+        # keys and seeds are drawn like createMIDI.py does, so a request reproduces a run
+        # (renders with no seed are not reproducible, they get no seed and are never cached)
+        choicesSeed, sonifierSeed = np.random.SeedSequence(seed).spawn(2)
+        if key is None:
+            key = int(np.random.default_rng(choicesSeed).integers(0, 12))
+        return (wuss, scale, key, sonifierSeed if seed is not None else None, layout)
+
+    def send(self, status, contentType, data, headers = {}):
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def sendText(self, status, message, headers = {}):
+        self.send(status, 'text/plain; charset=utf-8', (message + '\n').encode('utf-8'), headers)
+
+    def sendJson(self, status, report):
+        self.send(status, 'application/json', (json.dumps(report, indent = 1) + '\n').encode('utf-8'))
+
+    # Unix socket clients have no address
+    def address_string(self):
+        return self.client_address[0] if isinstance(self.client_address, tuple) else self.server.server_address
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+# the same server on a Unix socket, only local processes can reach
+class SonifyUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # a socket left by a server that didn't stop cleanly
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+
+# create a server bound to a Unix socket (socketPath) or to host:port
+def createServer(pool, socketPath = None, host = '127.0.0.1', port = 8765, structuresDir = 'RNA structures',
+                 maxBodyBytes = 16 << 20, quiet = False):
+    if socketPath is not None:
+        server = SonifyUnixServer(socketPath, SonifyHandler)
+    else:
+        server = http.server.ThreadingHTTPServer((host, port), SonifyHandler)
+    server.pool = pool
+    server.structuresDir = structuresDir
+    server.maxBodyBytes = maxBodyBytes
+    server.quiet = quiet
+    return server
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Serve MIDI files of RNA secondary structures over HTTP')
+    parser.add_argument('--socket', default = None, help = 'path of a Unix socket to listen on, instead of a TCP port')
+    parser.add_argument('--host', default = '127.0.0.1', help = 'address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type = int, default = 8765, help = 'port to listen on (default: 8765)')
+    parser.add_argument('-j', '--workers', type = int, default = None,
+                        help = 'number of worker processes (default: number of CPUs)')
+    parser.add_argument('--queue', type = int, default = 16,
+                        help = 'requests waiting for a worker before new ones are refused with 503 (default: 16)')
+    parser.add_argument('--timeout', type = float, default = 60.0,
+                        help = 'seconds a request waits for its render before a 504 (default: 60)')
+    parser.add_argument('--structures', default = 'RNA structures',
+                        help = "directory of the structures requested by name (default: 'RNA structures')")
+    parser.add_argument('--max-length', type = float, default = 16,
+                        help = 'largest structure accepted in a request body, in MB (default: 16)')
+    parser.add_argument('--cache', default = None, help = 'directory of a cache of rendered MIDI files')
+    parser.add_argument('--cache-size', type = float, default = 256, help = 'size cap of the cache in MB (default: 256)')
+    parser.add_argument('--quiet', action = 'store_true', help = 'do not log every request')
+    args = parser.parse_args()
+    if args.socket is not None and not hasattr(socket, 'AF_UNIX'):
+        parser.error('Unix sockets are not available on this platform')
+
+    pool = RenderPool(args.workers, args.queue, args.cache, int(args.cache_size * (1 << 20)), args.timeout)
+    server = createServer(pool, args.socket, args.host, args.port, args.structures,
+                          int(args.max_length * (1 << 20)), args.quiet)
+    print('Serving on %s with %d workers' % (args.socket or 'http://%s:%d' % (args.host, args.port), pool.workers),
+          file = sys.stderr)
+    # stop like on ctrl-c when the service manager stops the server
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
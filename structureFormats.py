@@ -0,0 +1,190 @@
+'''
+Read structures written in standard formats and convert them to CSSD
+-Vienna / FASTA files: '>name' headers, optional sequence lines and dot-bracket structures
+ ('()' pairs, '[]' '{}' '<>' pseudoknots, an optional energy after the structure)
+-Stockholm files (Rfam): the '#=GC SS_cons' consensus structure of every alignment, in WUSS
+ notation ('<>' '()' '[]' '{}' nested pairs, letters 'Aa' 'Bb'... pseudoknots)
+-Records are read lazily, one at a time, so files with thousands of records are never loaded whole
+-Pairs enclosing a multi-branched loop become '(' ')', the other ones '<' '>'. Unpaired nucleotides
+ become '_' in hairpin loops, '-' in interior loops, ',' in multi-branched loops and ':' outside
+ of every pair. Pseudoknot pairs become '[' ']'
+'''
+
+import os
+import re
+import gzip
+import numpy as np
+import structureIndex
+
+# matched pairs of a bracket family (see structureIndex.matchBrackets), positions are numpy arrays
+def findBracketPairs(nucl, openChar, closeChar):
+    return structureIndex.matchBrackets(nucl == ord(openChar), nucl == ord(closeChar), repr(openChar + closeChar))
+
+# convert the pairs of a structure to CSSD, nestedPairs and pseudoknotPairs are (opens, closes) arrays
+# returns a structureIndex.StructureIndex, its pair table comes from the conversion
+def pairsToCSSD(numberOfNucl, nestedPairs, pseudoknotPairs):
+    opens = np.concatenate([pairs[0] for pairs in nestedPairs] + [np.zeros(0, dtype = np.int64)])
+    closes = np.concatenate([pairs[1] for pairs in nestedPairs] + [np.zeros(0, dtype = np.int64)])
+
+    delta = np.zeros(numberOfNucl, dtype = np.int64)
+    delta[opens] = 1
+    delta[closes] = -1
+    depths = np.cumsum(delta)
+    if len(depths) and depths.min() < 0:
+        raise structureIndex.StructureError('crossing pairs', int(np.argmax(depths < 0)))
+
+    # each pair is found by its level (depth after opening) and position, the innermost pair around
+    # a position at some level is the last one opened at that level before it
+    levels = depths[opens]
+    pairKeys = levels * (numberOfNucl + 1) + opens
+    order = np.argsort(pairKeys)
+    opens, closes, levels, pairKeys = opens[order], closes[order], levels[order], pairKeys[order]
+
+    def enclosingPair(positions, positionLevels):
+        pairs = np.searchsorted(pairKeys, positionLevels * (numberOfNucl + 1) + positions, side = 'right') - 1
+        return np.where(positionLevels > 0, pairs, -1)
+
+    # number of pairs directly enclosed by each pair
+    parents = enclosingPair(opens, levels - 1)
+    children = np.bincount(parents[parents >= 0], minlength = len(opens))
+    if len(closes) and (closes[parents[parents >= 0]] < closes[parents >= 0]).any():
+        raise structureIndex.StructureError('crossing pairs')
+
+    # pairs closing a multi-branched loop, and every pair around one, are helices '(' ')'
+    isMultiloop = np.zeros(numberOfNucl + 1, dtype = np.int64)
+    isMultiloop[opens[children >= 2] + 1] = 1
+    multiloopsBefore = np.cumsum(isMultiloop)
+    isHelix = multiloopsBefore[closes] > multiloopsBefore[opens]
+
+    cssd = np.full(numberOfNucl, ord(':'), dtype = np.uint8)
+    cssd[opens] = np.where(isHelix, ord('('), ord('<'))
+    cssd[closes] = np.where(isHelix, ord(')'), ord('>'))
+
+    # unpaired nucleotides (and pseudoknots) take the kind of loop they are in,
+    # with no nested pair at all they are all outside of every pair (':')
+    if len(opens):
+        unpaired = np.ones(numberOfNucl, dtype = bool)
+        unpaired[opens] = False
+        unpaired[closes] = False
+        positions = np.flatnonzero(unpaired)
+        loops = enclosingPair(positions, depths[positions])
+        loopKinds = np.array([ord('_'), ord('-'), ord(',')], dtype = np.uint8)
+        cssd[positions] = np.where(loops >= 0, loopKinds[np.minimum(children[np.maximum(loops, 0)], 2)], ord(':'))
+
+    pairTable = np.full(numberOfNucl, -1, dtype = np.int64)
+    pairTable[opens] = closes
+    pairTable[closes] = opens
+    for pkOpens, pkCloses in pseudoknotPairs:
+        cssd[pkOpens] = ord('[')
+        cssd[pkCloses] = ord(']')
+        pairTable[pkOpens] = pkCloses
+        pairTable[pkCloses] = pkOpens
+
+    return structureIndex.StructureIndex(cssd.tobytes().decode('ascii'), pairTable)
+
+# convert a Vienna dot-bracket structure: '()' pairs, '[]' '{}' '<>' pseudoknots, anything else unpaired
+def viennaToCSSD(structure):
+    nucl = np.frombuffer(structure.encode('ascii', 'replace'), dtype = np.uint8)
+    return pairsToCSSD(len(nucl), [findBracketPairs(nucl, '(', ')')],
+                       [findBracketPairs(nucl, openChar, closeChar) for openChar, closeChar in ('[]', '{}', '<>')])
+
+# convert a WUSS structure (Stockholm SS_cons): '<>' '()' '[]' '{}' nested pairs,
+# upper case letters paired with their lower case as pseudoknots, anything else unpaired
+def wussToCSSD(structure):
+    nucl = np.frombuffer(structure.encode('ascii', 'replace'), dtype = np.uint8)
+    nested = [findBracketPairs(nucl, openChar, closeChar) for openChar, closeChar in ('<>', '()', '[]', '{}')]
+    pseudoknots = [findBracketPairs(nucl, letter, letter.lower())
+                   for letter in sorted(set(structure) & set('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))]
+    return pairsToCSSD(len(nucl), nested, pseudoknots)
+
+viennaStructure = re.compile(r'^([().\[\]{}<>]+)(\s+\(\s*[-+]?\d+(\.\d*)?\s*\))?\s*$')
+
+# read Vienna / FASTA records from lines, yields (name, dot-bracket structure)
+# a record is a '>' header followed by sequence and structure lines, lines of a structure split in
+# several lines are joined. Structures with no header are named after their line number
+def iterViennaRecords(lines, name = 'structure'):
+    header = None
+    structure = []
+    lineNumber = 0
+    for lineNumber, line in enumerate(lines, 1):
+        line = line.strip()
+        if line.startswith('>'):
+            if structure:
+                yield (header, ''.join(structure))
+            header = line[1:].split()[0] if line[1:].split() else '%s_%d' % (name, lineNumber)
+            structure = []
+            continue
+        match = viennaStructure.match(line)
+        if not match:
+            continue
+        if header is None:
+            # bare structures, one per line
+            yield ('%s_%d' % (name, lineNumber), match.group(1))
+            continue
+        structure.append(match.group(1))
+        if match.group(2):
+            # the energy ends the structure
+            yield (header, ''.join(structure))
+            structure = []
+            header = '%s_%d' % (name, lineNumber)
+    if structure:
+        yield (header, ''.join(structure))
+
+# read Stockholm records from lines, yields (name, WUSS consensus structure) for each alignment
+# with a '#=GC SS_cons' line. The name is the alignment ID (or accession)
+def iterStockholmRecords(lines, name = 'alignment'):
+    ids = {}
+    structure = []
+    records = 0
+    for line in lines:
+        if line.startswith('#=GF ID') or line.startswith('#=GF AC'):
+            ids[line[5:7]] = line[7:].strip()
+        elif line.startswith('#=GC SS_cons'):
+            structure.append(line[12:].strip())
+        elif line.startswith('//'):
+            records += 1
+            if structure:
+                yield (ids.get('ID', ids.get('AC', '%s_%d' % (name, records))), ''.join(structure))
+            ids = {}
+            structure = []
+    if structure:
+        yield (ids.get('ID', ids.get('AC', '%s_%d' % (name, records + 1))), ''.join(structure))
+
+stockholmExtensions = ('.sto', '.stk', '.stockholm', '.seed')
+viennaExtensions = ('.fa', '.fasta', '.db', '.dbn', '.vienna')
+
+# open a text file, gzip compressed ones (.gz) are read on the fly
+def openText(filename):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rt')
+    return open(filename, 'r')
+
+# is a file made of records (Stockholm or Vienna) rather than a single CSSD structure
+def isRecordFile(filename):
+    name = filename[:-3] if filename.endswith('.gz') else filename
+    return name.lower().endswith(stockholmExtensions + viennaExtensions)
+
+# read the structures of a Stockholm or Vienna file one at a time, without converting them
+# yields (name, structure, converter), converter(structure) gives its StructureIndex
+# the format is told by the '# STOCKHOLM' header, the file is read lazily
+def iterRawRecords(filename):
+    name = os.path.splitext(os.path.basename(filename[:-3] if filename.endswith('.gz') else filename))[0]
+    with openText(filename) as f:
+        firstLine = f.readline()
+        lines = iterLines(firstLine, f)
+        if firstLine.startswith('# STOCKHOLM'):
+            for recordName, structure in iterStockholmRecords(lines, name):
+                yield (recordName, structure, wussToCSSD)
+        else:
+            for recordName, structure in iterViennaRecords(lines, name):
+                yield (recordName, structure, viennaToCSSD)
+
+# read the structures of a Stockholm or Vienna file one at a time, yields (name, StructureIndex)
+def iterStructureRecords(filename):
+    for name, structure, converter in iterRawRecords(filename):
+        yield (name, converter(structure))
+
+# the lines of a file whose first line was already read
+def iterLines(firstLine, f):
+    yield firstLine
+    yield from f
@@ -0,0 +1,165 @@
+'''
+Validation and indexing of CSSD structures before they are sonified
+-The alphabet and the bracket balance are checked in one vectorized pass, any problem raises
+ a StructureError with its position before any MIDI work is done
+-The pair table holds the partner of every paired nucleotide: '(' ')' and '<' '>' nest together,
+ '[' ']' pseudoknots are matched on their own
+-A StructureIndex keeps the structure and its pair table, so later stages don't rescan the string
+-Structures streamed in chunks are checked with checkChunks, which only keeps bracket depths and the
+ kinds of the helix and stem brackets still open, so memory depends on the nesting depth, not the length
+'''
+
+import numpy as np
+
+# characters of the CSSD format (see randomRNA.py)
+cssdAlphabet = '()<>[]_-,:'
+
+isCSSD = np.zeros(256, dtype = bool)
+isCSSD[np.frombuffer(cssdAlphabet.encode('ascii'), dtype = np.uint8)] = True
+
+class StructureError(ValueError):
+
+    def __init__(self, message, position = None):
+        if position is not None:
+            message = '%s (position %d)' % (message, position)
+        super().__init__(message)
+        self.position = position
+
+def toBytes(wuss):
+    return np.frombuffer(wuss.encode('ascii', 'replace'), dtype = np.uint8)
+
+# raise a StructureError for the first character out of the CSSD alphabet, offset is the position of wuss
+def checkAlphabet(wuss, nucl, offset = 0):
+    invalid = ~isCSSD[nucl]
+    if invalid.any():
+        position = int(np.argmax(invalid))
+        raise StructureError('invalid character %r' % wuss[position], offset + position)
+
+# match opening and closing brackets of one family (boolean arrays of their positions)
+# returns the positions of the opening brackets and of their closing ones
+def matchBrackets(opens, closes, name):
+    depths = np.cumsum(opens.astype(np.int64) - closes)
+    if len(depths) and depths.min() < 0:
+        raise StructureError('unmatched %s closing bracket' % name, int(np.argmax(depths < 0)))
+    if len(depths) and depths[-1] > 0:
+        # an opening bracket is left open if the depth never goes back below its level
+        lowestAfter = np.minimum.accumulate(depths[::-1])[::-1]
+        raise StructureError('unmatched %s opening bracket' % name, int(np.argmax(opens & (lowestAfter >= depths))))
+
+    # sorted by level, then position, brackets of a level alternate between opening and closing
+    positions = np.flatnonzero(opens | closes)
+    levels = np.where(opens, depths, depths + 1)[positions]
+    pairs = positions[np.lexsort((positions, levels))].reshape(-1, 2)
+    return (pairs[:, 0], pairs[:, 1])
+
+# check a CSSD string and find the partner of each nucleotide (-1 for unpaired ones)
+def findPairTable(wuss):
+    nucl = toBytes(wuss)
+    checkAlphabet(wuss, nucl)
+
+    pairTable = np.full(len(nucl), -1, dtype = np.int64)
+
+    # helices and stems are one nested family, a '(' must be closed by a ')' and a '<' by a '>'
+    opens, closes = matchBrackets((nucl == ord('(')) | (nucl == ord('<')),
+                                  (nucl == ord(')')) | (nucl == ord('>')), 'helix or stem')
+    mismatched = (nucl[opens] == ord('(')) != (nucl[closes] == ord(')'))
+    if mismatched.any():
+        first = int(np.argmax(mismatched))
+        raise StructureError('%r closed by %r at %d' % (wuss[opens[first]], wuss[closes[first]], closes[first]),
+                             int(opens[first]))
+    pairTable[opens] = closes
+    pairTable[closes] = opens
+
+    # pseudoknots can cross the other pairs
+    opens, closes = matchBrackets(nucl == ord('['), nucl == ord(']'), 'pseudoknot')
+    pairTable[opens] = closes
+    pairTable[closes] = opens
+
+    return pairTable
+
+# a checked structure and its pair table
+class StructureIndex:
+
+    def __init__(self, wuss, pairTable = None):
+        self.wuss = wuss
+        self.pairTable = findPairTable(wuss) if pairTable is None else pairTable
+
+    def __len__(self):
+        return len(self.wuss)
+
+# index a CSSD string, structures already indexed are returned as they are
+def indexStructure(structure):
+    if isinstance(structure, StructureIndex):
+        return structure
+    return StructureIndex(structure)
+
+# check that the helix and stem brackets of a chunk are closed by their own kind, '(' by ')' and '<' by '>'
+# openKinds and openPositions are the brackets still open before the chunk, from the outermost one
+# (the chunk is balanced against them already). Returns the brackets still open after the chunk
+def matchKinds(nucl, offset, openKinds, openPositions):
+    opens = (nucl == ord('(')) | (nucl == ord('<'))
+    positions = np.flatnonzero(opens | (nucl == ord(')')) | (nucl == ord('>')))
+    if len(positions) == 0:
+        return (openKinds, openPositions)
+    isOpen = opens[positions]
+    depths = len(openKinds) + np.cumsum(np.where(isOpen, 1, -1))
+    levels = np.where(isOpen, depths, depths + 1)
+
+    # sorted by level, then position (see matchBrackets): a closing bracket closes the opening one
+    # before it at its level, or the one of its level open before the chunk
+    order = np.lexsort((positions, levels))
+    positions, isOpen, levels = positions[order], isOpen[order], levels[order]
+    closeRows = np.flatnonzero(~isOpen)
+    inChunk = closeRows > 0
+    inChunk[inChunk] = (levels[closeRows[inChunk] - 1] == levels[closeRows[inChunk]]) & isOpen[closeRows[inChunk] - 1]
+    pairKinds = np.zeros(len(closeRows), dtype = np.uint8)
+    pairPositions = np.zeros(len(closeRows), dtype = np.int64)
+    pairKinds[inChunk] = nucl[positions[closeRows[inChunk] - 1]]
+    pairPositions[inChunk] = offset + positions[closeRows[inChunk] - 1]
+    pairKinds[~inChunk] = openKinds[levels[closeRows[~inChunk]] - 1]
+    pairPositions[~inChunk] = openPositions[levels[closeRows[~inChunk]] - 1]
+
+    closeKinds = nucl[positions[closeRows]]
+    mismatched = (pairKinds == ord('(')) != (closeKinds == ord(')'))
+    if mismatched.any():
+        first = int(np.argmax(mismatched))
+        raise StructureError('%r closed by %r at %d' % (chr(pairKinds[first]), chr(closeKinds[first]),
+                                                        offset + positions[closeRows[first]]), int(pairPositions[first]))
+
+    # the last bracket of each level is still open if it is an opening one
+    depth = int(depths[-1])
+    kept = min(depth, len(openKinds))
+    newKinds = np.concatenate((openKinds[:kept], np.zeros(depth - kept, dtype = np.uint8)))
+    newPositions = np.concatenate((openPositions[:kept], np.zeros(depth - kept, dtype = np.int64)))
+    isLast = np.append(levels[1:] != levels[:-1], True) & isOpen & (levels <= depth)
+    newKinds[levels[isLast] - 1] = nucl[positions[isLast]]
+    newPositions[levels[isLast] - 1] = offset + positions[isLast]
+    return (newKinds, newPositions)
+
+# pass chunks of a structure through, checking the alphabet, the balance of every bracket family
+# and the kinds of the helix and stem brackets (without the pair table, so memory only grows
+# with the nesting depth, not with the length of the structure)
+def checkChunks(chunks):
+    offset = 0
+    depths = {'helix or stem': 0, 'pseudoknot': 0}
+    families = {'helix or stem': ('(<', ')>'), 'pseudoknot': ('[', ']')}
+    openKinds = np.zeros(0, dtype = np.uint8)
+    openPositions = np.zeros(0, dtype = np.int64)
+    for chunk in chunks:
+        nucl = toBytes(chunk)
+        checkAlphabet(chunk, nucl, offset)
+        for name, (openChars, closeChars) in families.items():
+            opens = np.isin(nucl, list(openChars.encode('ascii')))
+            closes = np.isin(nucl, list(closeChars.encode('ascii')))
+            chunkDepths = depths[name] + np.cumsum(opens.astype(np.int64) - closes)
+            if len(chunkDepths) and chunkDepths.min() < 0:
+                raise StructureError('unmatched %s closing bracket' % name, offset + int(np.argmax(chunkDepths < 0)))
+            if len(chunkDepths):
+                depths[name] = int(chunkDepths[-1])
+        openKinds, openPositions = matchKinds(nucl, offset, openKinds, openPositions)
+        offset += len(chunk)
+        yield chunk
+
+    for name, depth in depths.items():
+        if depth:
+            raise StructureError('%d unmatched %s opening brackets' % (depth, name))
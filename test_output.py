@@ -0,0 +1,60 @@
+'''
+Regression test of the midi output of the bundled structures
+-Every optimization must keep the melody and pseudoknots files byte for byte, so their
+ sha256 hashes are pinned for a fixed seed and key
+-The structures are rendered in memory (renderMidiFiles) and streamed from their file (sonifyFile)
+-random.txt is left out, it is written again on every random run of createMIDI.py
+Run with: python -m pytest -q
+'''
+
+import hashlib
+import os
+import pytest
+import createMIDI
+
+structuresDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'RNA structures')
+
+# sha256 of the melody and pseudoknots files of each structure, Minor scale in C with seed 1
+expectedHashes = {
+    '1L146': ('9dcf106fb680c34aa78dfb5b2fcf8c0e2a7c7ab5c9ff2d48bf0b5290c43b065c',
+              'cd30841d4660850cdde6d34ca2cf27764e71e7f2f9ce0290e8814d26b2edeed4'),
+    '2L111PK': ('dfead5e9e7483c9e243a295e3aa826470d8bef245289ddf797216733df5d52ad',
+                '35d998d4f08c8d6a75dc8e6dbdba6525280b66b9b5282d56a146aae278b2b0ff'),
+    '2L149': ('25b6bdabba2ebf758af62a1bc93ee3cc39f3f5620fb9486f4f090757a925eec3',
+              '385560094e4f2e0d9d049dd7e8d9e755514c587b692265efafafbca90ae44801'),
+    '3L127': ('6ef9d26a11ee4c64b2cf25027ed212b7dd75239ae8f5bbcab499868737c6006d',
+              'f5634ea11fdc71e84adcbd1b2aef38de7f834b60af41fccf56344b1747d55dcf'),
+    '3L150PK': ('d815d52919a38622889446aa447bc4432b701b844dd6f786f3f2ecf083787aa7',
+                'a73ff756211687f6964a3d06772ff50b21782fb702bb51dafe4656b0944402ca'),
+    'NC_002640.1': ('5c5e26884fba4095aceb65e907f128daabe7f6032aa142595cd9494bd0637bbb',
+                    'f4634c01da0daba6780d3d3acdb0fd1d4f2a8b39fc92326a785bc58881b05d26'),
+}
+
+def structureFile(name):
+    return os.path.join(structuresDir, name + '.txt')
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+# the structures rendered in memory
+@pytest.mark.parametrize('name', sorted(expectedHashes))
+def testRenderMidiFiles(name):
+    f = open(structureFile(name), 'r')
+    wuss = ''.join(f.read().split())
+    f.close()
+    files = createMIDI.Sonifier('Minor', 0, seed = 1).renderMidiFiles(wuss)
+    assert tuple(sha256(data) for data in files) == expectedHashes[name]
+
+# the structures streamed from their file in small chunks, straight to midi files
+@pytest.mark.parametrize('name', sorted(expectedHashes))
+def testSonifyFile(name, tmp_path):
+    midiFilename = str(tmp_path / 'melody.mid')
+    midiFilenamePK = str(tmp_path / 'pseudoknots.mid')
+    createMIDI.Sonifier('Minor', 0, seed = 1).sonifyFile(structureFile(name), midiFilename, midiFilenamePK,
+                                                         chunkSize = 16)
+    files = []
+    for filename in (midiFilename, midiFilenamePK):
+        f = open(filename, 'rb')
+        files.append(f.read())
+        f.close()
+    assert tuple(sha256(data) for data in files) == expectedHashes[name]
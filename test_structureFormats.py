@@ -0,0 +1,53 @@
+'''
+Tests of the Vienna and Stockholm readers and of their conversion to CSSD
+-Records with no nested pair (RNAfold's output for an unstructured sequence) or only pseudoknots
+-Vienna structures split in several lines, Stockholm SS_cons split in several blocks
+Run with: python -m pytest -q
+'''
+
+import structureFormats
+
+# the pair table of a StructureIndex as a list
+def pairs(structure):
+    return [int(partner) for partner in structure.pairTable]
+
+def testNoPairs():
+    structure = structureFormats.viennaToCSSD('.........')
+    assert structure.wuss == ':::::::::'
+    assert pairs(structure) == [-1] * 9
+
+def testPseudoknotsOnly():
+    structure = structureFormats.viennaToCSSD('..[[..]]..')
+    assert structure.wuss == '::[[::]]::'
+    assert pairs(structure) == [-1, -1, 7, 6, -1, -1, 3, 2, -1, -1]
+
+    structure = structureFormats.wussToCSSD('::AA::aa:')
+    assert structure.wuss == '::[[::]]:'
+    assert pairs(structure) == [-1, -1, 7, 6, -1, -1, 3, 2, -1]
+
+def testNestedAndPseudoknots():
+    structure = structureFormats.viennaToCSSD('((..[[..))..]]')
+    assert structure.wuss == '<<__[[__>>::]]'
+    assert pairs(structure) == [9, 8, -1, -1, 13, 12, -1, -1, 1, 0, -1, -1, 5, 4]
+
+def testMultiLineVienna():
+    lines = ['>hairpin', 'GGGAAACCC', '(((...', '))) (-1.20)', '>unstructured', 'ACGU', '....']
+    assert list(structureFormats.iterViennaRecords(lines)) == [('hairpin', '(((...)))'), ('unstructured', '....')]
+
+def testMultiBlockStockholm():
+    lines = ['# STOCKHOLM 1.0', '#=GF ID tRNA', '#=GC SS_cons <<<__', '#=GC SS_cons _>>>:', '//',
+             '#=GC SS_cons ::AA::aa:', '//']
+    assert list(structureFormats.iterStockholmRecords(lines)) == [('tRNA', '<<<___>>>:'), ('alignment_2', '::AA::aa:')]
+
+# records read from files, with their conversion
+def testRecordFiles(tmp_path):
+    vienna = tmp_path / 'structures.db'
+    vienna.write_text('>unstructured\nACGUACGUA\n.........\n>hairpin\nGGGAAACCC\n(((...)))\n')
+    stockholm = tmp_path / 'family.sto'
+    stockholm.write_text('# STOCKHOLM 1.0\n#=GF ID knot\n#=GC SS_cons ::AA::aa:\n//\n')
+
+    records = list(structureFormats.iterStructureRecords(str(vienna)))
+    assert [(name, structure.wuss) for name, structure in records] == [('unstructured', ':::::::::'),
+                                                                      ('hairpin', '<<<___>>>')]
+    records = list(structureFormats.iterStructureRecords(str(stockholm)))
+    assert [(name, structure.wuss) for name, structure in records] == [('knot', '::[[::]]:')]